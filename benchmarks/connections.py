@@ -0,0 +1,83 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from benchmarks.server import serve
+from benchmarks.workloads import Workloads, bench_admin
+
+# endpoints that query the database on every call, so each request
+# needs a connection; the book list may be answered from the cache
+CONNECTION_WEIGHTS = {"borrowing_list": 1, "payment_list": 1}
+MODES = {
+    "per_request": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": False},
+    "persistent_health_checks": {
+        "CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True,
+    },
+}
+
+
+@contextmanager
+def database_options(**options):
+    """
+    Applies `options` to every database alias for connections opened in
+    the block; each thread's wrapper shares its alias's settings dict
+    """
+    saved = {
+        alias: {name: settings_dict.get(name) for name in options}
+        for alias, settings_dict in connections.settings.items()
+    }
+    connections.close_all()
+    for settings_dict in connections.settings.values():
+        settings_dict.update(options)
+    try:
+        yield
+    finally:
+        for alias, settings_dict in connections.settings.items():
+            settings_dict.update(saved[alias])
+        connections.close_all()
+
+
+@contextmanager
+def count_connections():
+    """Yields a dict whose "opened" counts connections made in the block"""
+    counter = {"opened": 0}
+    lock = threading.Lock()
+
+    def opened(sender, connection, **kwargs):
+        with lock:
+            counter["opened"] += 1
+
+    connection_created.connect(opened, weak=False)
+    try:
+        yield counter
+    finally:
+        connection_created.disconnect(opened)
+
+
+def compare_connection_modes(requests, concurrency, seed=0, warmup=0):
+    """
+    Replays database-bound list calls against a fixed pool of
+    `concurrency` server threads once per entry of MODES and reports the
+    latency, throughput and connections opened in each
+    """
+    report = {}
+    for name, options in MODES.items():
+        with (
+            database_options(**options),
+            serve(server="gthread", threads=concurrency) as base_url,
+        ):
+            workloads = Workloads(
+                base_url, bench_admin(), seed, CONNECTION_WEIGHTS
+            )
+            workloads.run(warmup, concurrency)
+            with count_connections() as counter:
+                result = workloads.run(requests, concurrency)
+        report[name] = {
+            **options,
+            "connections_opened": counter["opened"],
+            **result,
+        }
+    return report
@@ -0,0 +1,141 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from benchmarks.database import throwaway_database
+from benchmarks.server import SERVERS, serve
+from benchmarks.stubs import stubbed_services
+from benchmarks.workloads import WEIGHTS, Workloads, bench_admin
+from library.seeding import LibrarySeeder
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds benchmark data and replays a concurrent mix of API calls, "
+        "printing per-endpoint p50/p95/p99 latency and throughput as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=2000)
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--borrowings", type=int, default=5000)
+        parser.add_argument("--payment-ratio", type=float, default=0.3)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--warmup", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--server",
+            choices=SERVERS,
+            default="wsgi",
+            help="Serve the in-process API over WSGI (threads) or ASGI "
+                 "(uvicorn, as deployed)",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file"
+        )
+        parser.add_argument(
+            "--base-url",
+            help="Benchmark a running server that shares this project's "
+                 "database instead of a throwaway in-process one. Stripe "
+                 "and Telegram are not stubbed there.",
+        )
+        parser.add_argument(
+            "--admin-email",
+            help="With --base-url, the existing staff user that returns "
+                 "books; no account is created in that database",
+        )
+        parser.add_argument(
+            "--no-seed",
+            action="store_true",
+            help="With --base-url, reuse the data already in the database",
+        )
+
+    def handle(self, *args, **options):
+        if options["base_url"]:
+            admin = self.existing_admin(options["admin_email"])
+            if not options["no_seed"]:
+                self.seed(options)
+            report = self.measure(options["base_url"], admin, options)
+        else:
+            report = self.run_in_process(options)
+
+        report = {
+            "commit": current_commit(),
+            "started_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "config": {
+                key: options[key]
+                for key in (
+                    "books", "users", "borrowings", "payment_ratio",
+                    "requests", "warmup", "concurrency", "seed", "server",
+                    "base_url",
+                )
+            },
+            "weights": WEIGHTS,
+            **report,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
+
+    def run_in_process(self, options):
+        """Fresh test database, in-process server, stubbed services"""
+        with throwaway_database():
+            self.seed(options)
+            with (
+                stubbed_services(),
+                serve(server=options["server"]) as base_url,
+            ):
+                return self.measure(base_url, bench_admin(), options)
+
+    @staticmethod
+    def existing_admin(email):
+        if not email:
+            raise CommandError("--base-url needs --admin-email")
+        admin = get_user_model().objects.filter(
+            email=email, is_staff=True
+        ).first()
+        if admin is None:
+            raise CommandError(f"No staff user {email}")
+        return admin
+
+    def seed(self, options):
+        self.stderr.write("Seeding benchmark data...")
+        LibrarySeeder(
+            books=options["books"],
+            users=options["users"],
+            borrowings=options["borrowings"],
+            payment_ratio=options["payment_ratio"],
+            seed=options["seed"],
+        ).run()
+
+    def measure(self, base_url, admin, options):
+        self.stderr.write(
+            f"Running {options['requests']} requests against {base_url} "
+            f"with {options['concurrency']} clients..."
+        )
+        workloads = Workloads(base_url, admin, seed=options["seed"])
+        return workloads.run(
+            options["requests"],
+            options["concurrency"],
+            warmup=options["warmup"],
+        )
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.connections import compare_connection_modes
+from benchmarks.database import throwaway_database
+from library.seeding import LibrarySeeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves the API from a fixed pool of threads and replays database "
+        "bound list calls with a connection per request, persistent "
+        "connections and persistent connections with health checks, "
+        "printing latency and connections opened as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--warmup", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.stderr.write("Seeding benchmark data...")
+            LibrarySeeder(
+                books=500, users=100, borrowings=2000, seed=options["seed"]
+            ).run()
+            report = compare_connection_modes(
+                options["requests"],
+                options["concurrency"],
+                seed=options["seed"],
+                warmup=options["warmup"],
+            )
+        self.stdout.write(json.dumps(report, indent=2))
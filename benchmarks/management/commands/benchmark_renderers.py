@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.database import throwaway_database
+from benchmarks.renderers import compare_renderers
+from books.models import Book
+from books.serializers import BookSerializer
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingListSerializer
+from library.rows import row_formatter
+from library.seeding import LibrarySeeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares DRF's JSONRenderer with the project's orjson renderer on "
+        "seeded book and borrowing lists, printing the result as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with throwaway_database():
+            self.stderr.write("Seeding benchmark data...")
+            LibrarySeeder(
+                books=rows,
+                users=max(rows // 10, 1),
+                borrowings=rows,
+                seed=options["seed"],
+            ).run()
+            # the data the list views hand to the renderer
+            lists = {
+                "books": (Book.objects.order_by("id"), BookSerializer),
+                "borrowings": (
+                    Borrowing.objects.order_by("-id"),
+                    BorrowingListSerializer,
+                ),
+            }
+            report = {}
+            for name, (queryset, serializer_class) in lists.items():
+                formatter = row_formatter(serializer_class)
+                data = {
+                    "next": None,
+                    "previous": None,
+                    "results": formatter.format(formatter.values(queryset)),
+                }
+                report[name] = {
+                    "rows": len(data["results"]),
+                    **compare_renderers(data, options["repeat"]),
+                }
+        self.stdout.write(json.dumps(report, indent=2))
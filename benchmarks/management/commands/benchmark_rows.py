@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.database import throwaway_database
+from benchmarks.rows import compare_row_paths
+from books.models import Book
+from books.serializers import BookSerializer
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingListSerializer
+from library.seeding import LibrarySeeder
+from payments.models import Payment
+from payments.serializers import PaymentListSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-row cost of the list serializers with the "
+        "values() list path on seeded data, printing the result as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with throwaway_database():
+            self.stderr.write("Seeding benchmark data...")
+            LibrarySeeder(
+                books=rows,
+                users=max(rows // 10, 1),
+                borrowings=rows * 3,
+                seed=options["seed"],
+            ).run()
+            # a page of each list endpoint, as its view queries it
+            lists = {
+                "books": (
+                    Book.objects.order_by("id")[:rows], BookSerializer
+                ),
+                "borrowings": (
+                    Borrowing.objects.select_related("book", "user")
+                    .order_by("-id")[:rows],
+                    BorrowingListSerializer,
+                ),
+                "payments": (
+                    Payment.objects.order_by("-id")[:rows],
+                    PaymentListSerializer,
+                ),
+            }
+            report = {
+                name: compare_row_paths(
+                    queryset, serializer_class, options["repeat"]
+                )
+                for name, (queryset, serializer_class) in lists.items()
+            }
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,21 @@
+from rest_framework.renderers import JSONRenderer
+
+from benchmarks.rows import best_time
+from library.renderers import ORJSONRenderer
+
+
+def compare_renderers(data, repeat=5):
+    """Render time of data with DRF's JSONRenderer and ORJSONRenderer"""
+    json_time, json_body = best_time(
+        lambda: JSONRenderer().render(data), repeat
+    )
+    orjson_time, orjson_body = best_time(
+        lambda: ORJSONRenderer().render(data), repeat
+    )
+    return {
+        "bytes": len(json_body),
+        "json_ms": round(json_time * 1000, 2),
+        "orjson_ms": round(orjson_time * 1000, 2),
+        "speedup": round(json_time / orjson_time, 2),
+        "identical": json_body == orjson_body,
+    }
@@ -0,0 +1,47 @@
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from library.rows import RowFormatter
+
+
+def best_time(function, repeat):
+    """Fastest of `repeat` runs of function(), in seconds, and its result"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare_row_paths(queryset, serializer_class, repeat=5):
+    """
+    Renders the queryset to JSON through serializer_class and through
+    RowFormatter, fetching included, and reports the per-row cost of
+    each path and whether the two bodies are byte-identical.
+    """
+    renderer = JSONRenderer()
+    formatter = RowFormatter(serializer_class)
+
+    def serializer_path():
+        return renderer.render(
+            serializer_class(queryset.all(), many=True).data
+        )
+
+    def values_path():
+        return renderer.render(
+            formatter.format(formatter.values(queryset.all()))
+        )
+
+    serializer_time, serializer_body = best_time(serializer_path, repeat)
+    values_time, values_body = best_time(values_path, repeat)
+    rows = queryset.count()
+    return {
+        "rows": rows,
+        "serializer_us_per_row": round(serializer_time / rows * 1e6, 2),
+        "values_us_per_row": round(values_time / rows * 1e6, 2),
+        "speedup": round(serializer_time / values_time, 2),
+        "identical": serializer_body == values_body,
+    }
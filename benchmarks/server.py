@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    WSGIRequestHandler,
+    WSGIServer,
+)
+from django.conf import settings
+from django.db import connections
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+import uvicorn
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """
+    Serves requests on a fixed set of threads, like gunicorn's gthread
+    worker, so a thread can keep its database connection between requests
+    """
+
+    def __init__(self, *args, threads=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = queue.SimpleQueue()
+        self.workers = [
+            threading.Thread(target=self.work, daemon=True)
+            for _ in range(threads)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def work(self):
+        try:
+            while (item := self.requests.get()) is not None:
+                request, client_address = item
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+        finally:
+            connections.close_all()
+
+    def server_close(self):
+        super().server_close()
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+SERVERS = ("wsgi", "gthread", "asgi")
+
+
+@contextmanager
+def serve(host="127.0.0.1", port=0, server="wsgi", threads=8):
+    """
+    Runs the project in a WSGI server, a thread per request or a fixed
+    pool of `threads` ("gthread"), or in uvicorn, as deployed, and yields
+    its base URL
+    """
+    if server == "asgi":
+        run = serve_asgi(host, port)
+    elif server == "gthread":
+        run = serve_wsgi(host, port, PooledWSGIServer, threads=threads)
+    else:
+        run = serve_wsgi(host, port)
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, host]):
+        with run as base_url:
+            yield base_url
+
+
+@contextmanager
+def serve_wsgi(host, port, server_class=ThreadedWSGIServer, **kwargs):
+    server = server_class(
+        (host, port),
+        QuietWSGIRequestHandler,
+        allow_reuse_address=False,
+        **kwargs,
+    )
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@contextmanager
+def serve_asgi(host, port):
+    server = uvicorn.Server(uvicorn.Config(
+        get_asgi_application(),
+        host=host,
+        port=port,
+        lifespan="off",
+        log_level="warning",
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
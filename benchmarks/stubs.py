@@ -0,0 +1,37 @@
+import itertools
+from contextlib import ExitStack, contextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+from library.celery import app as celery_app
+
+_session_ids = itertools.count(1)
+
+
+def fake_checkout_session(**params):
+    session_id = f"cs_stub_{next(_session_ids)}"
+    return SimpleNamespace(
+        id=session_id, url=f"https://checkout.stripe.com/c/pay/{session_id}"
+    )
+
+
+@contextmanager
+def stubbed_services():
+    """
+    Keeps a benchmark off the network: Stripe and Telegram calls return
+    canned answers and Celery tasks run inline, so no broker is needed.
+    """
+    previous = celery_app.conf.task_always_eager
+    celery_app.conf.task_always_eager = True
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch(
+                "stripe.checkout.Session.create",
+                side_effect=fake_checkout_session,
+            ))
+            stack.enter_context(mock.patch(
+                "borrowings.telegram_actions.bot.send_message"
+            ))
+            yield
+    finally:
+        celery_app.conf.task_always_eager = previous
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase
+
+from benchmarks.connections import compare_connection_modes
+from benchmarks.renderers import compare_renderers
+from benchmarks.rows import compare_row_paths
+from benchmarks.server import serve
+from benchmarks.stubs import stubbed_services
+from benchmarks.workloads import (
+    WEIGHTS,
+    Workloads,
+    bench_admin,
+    percentile,
+    summarize,
+)
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingListSerializer
+from library.seeding import LibrarySeeder
+
+
+class PercentileTests(TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(1, percentile([1], 99))
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize_counts_errors(self):
+        report = summarize(
+            {
+                "book_list": [
+                    (0.01, 200), (0.03, 500), (0.02, 404), (0.04, 304)
+                ],
+                "borrow": [(0.01, 201), (0.02, 400), (0.03, 403)],
+            },
+            elapsed=1,
+        )
+        self.assertEqual(4, report["book_list"]["requests"])
+        self.assertEqual(2, report["book_list"]["errors"])
+        self.assertEqual(20, report["book_list"]["latency_ms"]["p50"])
+        self.assertEqual(4, report["book_list"]["throughput_rps"])
+        self.assertEqual(1, report["borrow"]["errors"])
+
+
+class RowPathBenchmarkTests(TestCase):
+    def test_reports_per_row_cost(self):
+        LibrarySeeder(books=10, users=3, borrowings=40, seed=1).run()
+
+        report = compare_row_paths(
+            Borrowing.objects.select_related("book").order_by("-id"),
+            BorrowingListSerializer,
+            repeat=1,
+        )
+
+        self.assertEqual(40, report["rows"])
+        self.assertTrue(report["identical"])
+        self.assertGreater(report["serializer_us_per_row"], 0)
+        self.assertGreater(report["values_us_per_row"], 0)
+
+
+class RendererBenchmarkTests(TestCase):
+    def test_reports_render_times(self):
+        data = {
+            "results": [{"id": i, "title": f"book {i}"} for i in range(50)]
+        }
+
+        report = compare_renderers(data, repeat=1)
+
+        self.assertTrue(report["identical"])
+        self.assertGreater(report["bytes"], 0)
+        self.assertGreater(report["json_ms"], 0)
+
+
+class WorkloadRunTests(TransactionTestCase):
+    def test_run_reports_every_workload(self):
+        LibrarySeeder(books=20, users=5, borrowings=30, seed=1).run()
+        with stubbed_services(), serve() as base_url:
+            report = Workloads(base_url, bench_admin(), seed=1).run(
+                total=60, concurrency=4
+            )
+
+        self.assertEqual(set(WEIGHTS), set(report["endpoints"]))
+        for name, endpoint in report["endpoints"].items():
+            self.assertEqual(0, endpoint["errors"], name)
+        self.assertGreater(Borrowing.objects.count(), 30)
+        self.assertLessEqual(
+            set(report["endpoints"]["payment_session"]["statuses"]),
+            {"200", "202"},
+        )
+
+    def test_asgi_server(self):
+        LibrarySeeder(books=20, users=5, borrowings=30, seed=1).run()
+        with stubbed_services(), serve(server="asgi") as base_url:
+            report = Workloads(base_url, bench_admin(), seed=1).run(
+                total=30, concurrency=4
+            )
+
+        for name, endpoint in report["endpoints"].items():
+            self.assertEqual(0, endpoint["errors"], name)
+
+
+class ConnectionBenchmarkTests(TransactionTestCase):
+    def test_persistent_connections_reused(self):
+        LibrarySeeder(books=10, users=5, borrowings=20, seed=1).run()
+
+        report = compare_connection_modes(requests=20, concurrency=2)
+
+        # one per request and database read from, with replicas
+        self.assertGreaterEqual(
+            report["per_request"]["connections_opened"], 20
+        )
+        # one per server thread and database at most
+        self.assertLessEqual(
+            report["persistent"]["connections_opened"],
+            2 * len(settings.DATABASES),
+        )
+        for name, mode in report.items():
+            for endpoint in mode["endpoints"].values():
+                self.assertEqual({"200": endpoint["requests"]},
+                                 endpoint["statuses"], name)
@@ -0,0 +1,227 @@
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import Payment
+from users.authentication import AccessToken
+
+SEARCH_TERMS = ("shadow", "tolkien", "winter garden", "dragon", "orwell")
+# relative frequency of each workload in a run
+WEIGHTS = {
+    "book_list": 25,
+    "book_search": 20,
+    "borrowing_list": 15,
+    "borrow": 15,
+    "return": 10,
+    "payment_list": 10,
+    "payment_session": 5,
+}
+# statuses besides 2xx/3xx that a workload gets by design
+EXPECTED_STATUSES = {
+    "borrow": {400},  # the picked book has no copies left
+}
+CLIENT_USERS = 50
+BENCH_ADMIN_EMAIL = "bench-admin@bench.local"
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    Per-workload latency percentiles (ms), status counts, throughput.
+    Responses other than 2xx/3xx and the workload's EXPECTED_STATUSES
+    count as errors.
+    """
+    report = {}
+    for name, results in sorted(samples.items()):
+        latencies = sorted(latency * 1000 for latency, _ in results)
+        statuses = defaultdict(int)
+        for _, status in results:
+            statuses[str(status)] += 1
+        expected = {str(status) for status in EXPECTED_STATUSES.get(name, ())}
+        report[name] = {
+            "requests": len(results),
+            "errors": sum(
+                count for status, count in statuses.items()
+                if not status.startswith(("2", "3"))
+                and status not in expected
+            ),
+            "statuses": dict(statuses),
+            "throughput_rps": round(len(results) / elapsed, 2),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 2),
+                "p95": round(percentile(latencies, 95), 2),
+                "p99": round(percentile(latencies, 99), 2),
+                "mean": round(sum(latencies) / len(latencies), 2),
+                "max": round(latencies[-1], 2),
+            },
+        }
+    return report
+
+
+def bench_admin():
+    """
+    The staff account the in-process benchmarks return books with,
+    created on first use; only for their throwaway databases
+    """
+    admin, _ = get_user_model().objects.get_or_create(
+        email=BENCH_ADMIN_EMAIL,
+        defaults={"is_staff": True, "is_superuser": True},
+    )
+    return admin
+
+
+class Workloads:
+    """
+    Replays a weighted, seeded mix of API calls (WEIGHTS, or `weights`)
+    against base_url. The clients are the first seeded users plus `admin`,
+    a staff user, for returns; their JWTs are minted locally, so the
+    server must share our database.
+    """
+
+    def __init__(self, base_url, admin, seed=0, weights=None):
+        self.base_url = base_url.rstrip("/")
+        self.rng = random.Random(seed)
+        self.weights = weights or WEIGHTS
+        self.lock = threading.Lock()
+
+        users = list(get_user_model().objects.filter(is_staff=False)
+                     .order_by("id")[:CLIENT_USERS])
+        tokens = {user.id: str(AccessToken.for_user(user)) for user in users}
+        self.user_tokens = list(tokens.values())
+        self.admin_token = str(AccessToken.for_user(admin))
+        self.book_ids = list(
+            Book.objects.order_by("id").values_list("id", flat=True)[:5000]
+        ) or [0]
+        self.active_borrowings = list(
+            Borrowing.objects.filter(actual_return_date__isnull=True)
+            .values_list("id", flat=True)[:1000]
+        )
+        # (payer's token, payment id): sessions are only shown to payers
+        self.user_payments = [
+            (tokens[user_id], payment_id)
+            for user_id, payment_id in Payment.objects.filter(
+                borrowing__user_id__in=tokens
+            ).values_list("borrowing__user_id", "id")[:1000]
+        ]
+        self.expected_return_date = str(
+            timezone.now().date() + timedelta(days=14)
+        )
+
+    def request(self, method, path, token, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method
+        )
+        request.add_header("Authorize", f"Bearer {token}")
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                payload = response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            payload = error.read()
+            status = error.code
+        except OSError:
+            payload, status = b"", "connection_error"
+        return time.perf_counter() - start, status, payload
+
+    def plan(self, total):
+        names = list(self.weights)
+        weights = [self.weights[name] for name in names]
+        return [
+            (name, self.rng.randrange(2 ** 32))
+            for name in self.rng.choices(names, weights, k=total)
+        ]
+
+    def run_one(self, name, seed):
+        rng = random.Random(seed)
+        token = rng.choice(self.user_tokens) if self.user_tokens else (
+            self.admin_token
+        )
+        if name == "book_list":
+            return self.request("GET", "/api/library/books/", token)
+        if name == "book_search":
+            term = urllib.request.quote(rng.choice(SEARCH_TERMS))
+            return self.request("GET", f"/api/library/books/?q={term}", token)
+        if name == "borrowing_list":
+            return self.request("GET", "/api/borrowings/", token)
+        if name == "borrow":
+            result = self.request(
+                "POST",
+                "/api/borrowings/",
+                token,
+                {
+                    "book": rng.choice(self.book_ids),
+                    "expected_return_date": self.expected_return_date,
+                },
+            )
+            if result[1] == 201:
+                with self.lock:
+                    self.active_borrowings.append(
+                        json.loads(result[2])["id"]
+                    )
+            return result
+        if name == "return":
+            with self.lock:
+                borrowing_id = (
+                    self.active_borrowings.pop()
+                    if self.active_borrowings else 0
+                )
+            return self.request(
+                "POST",
+                f"/api/borrowings/{borrowing_id}/return/",
+                self.admin_token,
+                {"actual_return_date": self.expected_return_date},
+            )
+        if name == "payment_list":
+            return self.request("GET", "/api/payments/", token)
+        if name == "payment_session":
+            token, payment_id = rng.choice(
+                self.user_payments or [(self.admin_token, 0)]
+            )
+            return self.request(
+                "GET", f"/api/payments/{payment_id}/session/", token
+            )
+        raise ValueError(f"Unknown workload: {name}")
+
+    def run(self, total, concurrency, warmup=0):
+        """Runs `total` timed calls after `warmup` untimed ones"""
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda call: self.run_one(*call),
+                          self.plan(warmup)))
+            calls = self.plan(total)
+            start = time.perf_counter()
+            results = list(
+                pool.map(lambda call: (call[0], self.run_one(*call)), calls)
+            )
+            elapsed = time.perf_counter() - start
+
+        samples = defaultdict(list)
+        for name, (latency, status, _) in results:
+            samples[name].append((latency, status))
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(len(results) / elapsed, 2),
+            "endpoints": summarize(samples, elapsed),
+        }
@@ -0,0 +1,71 @@
+import hashlib
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from library.cache import get_version, invalidate
+from library.routers import settled_reads
+
+CATALOGUE = "books:catalogue"
+# bumped when books are saved or deleted, never by inventory updates
+BOOK_EDITS = "books:edits"
+CATALOGUE_CACHE_TIMEOUT = 60 * 15
+
+
+def book_version_name(book_id):
+    return f"books:book:{book_id}"
+
+
+def invalidate_book(book_id):
+    """Drop the cached catalogue lists and the book's detail"""
+    invalidate_books(book_id)
+
+
+def invalidate_books(*book_ids):
+    """Drop the cached catalogue lists and the books' details"""
+    invalidate(
+        CATALOGUE, *(book_version_name(book_id) for book_id in book_ids)
+    )
+
+
+def invalidate_edited_book(book_id):
+    """Like `invalidate_book`, for changes beyond the inventory"""
+    invalidate(CATALOGUE, BOOK_EDITS, book_version_name(book_id))
+
+
+class CachedCatalogueMixin:
+    """
+    Serves list and retrieve responses from the cache. Lists are keyed by
+    the catalogue version and the absolute request URL (scheme and host,
+    which the cursor links are built from, filters, search and cursor),
+    details by the book's own version, so writes never have to find and
+    delete individual keys. Right after a change the response
+    is built from default, a replica may not show the change yet.
+    """
+
+    @staticmethod
+    def _cached(key, name, view, *args, **kwargs):
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        with settled_reads(name):
+            response = view(*args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, CATALOGUE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f"{CATALOGUE}:list:{get_version(CATALOGUE)}:{url}"
+        return self._cached(
+            key, CATALOGUE, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        name = book_version_name(pk)
+        key = f"{CATALOGUE}:detail:{pk}:{get_version(name)}"
+        return self._cached(
+            key, name, super().retrieve, request, *args, **kwargs
+        )
@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.seeding import LibrarySeeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams large, reproducible synthetic datasets (books, users, "
+        "borrowings, payments) into the database with COPY"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100_000)
+        parser.add_argument("--users", type=int, default=50_000)
+        parser.add_argument("--borrowings", type=int, default=1_000_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--chunk-size", type=int, default=50_000)
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Zipf exponent of book popularity, 0 borrows uniformly",
+        )
+        parser.add_argument(
+            "--returned-ratio",
+            type=float,
+            default=0.7,
+            help="Share of borrowings already returned",
+        )
+        parser.add_argument(
+            "--overdue-ratio",
+            type=float,
+            default=0.2,
+            help="Share of active borrowings past their return date",
+        )
+        parser.add_argument(
+            "--payment-ratio",
+            type=float,
+            default=0.3,
+            help="Share of borrowings with a payment (a fine if late)",
+        )
+        parser.add_argument(
+            "--paid-ratio",
+            type=float,
+            default=0.8,
+            help="Share of payments already paid",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="How far back returned borrowings go",
+        )
+
+    def handle(self, *args, **options):
+        for name in (
+            "returned_ratio", "overdue_ratio", "payment_ratio", "paid_ratio"
+        ):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be 0..1")
+        for name in ("books", "users", "borrowings", "days"):
+            if options[name] < 0:
+                raise CommandError(f"--{name} can't be negative")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        try:
+            seeder = LibrarySeeder(
+                books=options["books"],
+                users=options["users"],
+                borrowings=options["borrowings"],
+                seed=options["seed"],
+                chunk_size=options["chunk_size"],
+                skew=options["skew"],
+                returned_ratio=options["returned_ratio"],
+                overdue_ratio=options["overdue_ratio"],
+                payment_ratio=options["payment_ratio"],
+                paid_ratio=options["paid_ratio"],
+                days=options["days"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        start = time.perf_counter()
+        counts = seeder.run()
+        elapsed = time.perf_counter() - start
+        summary = ", ".join(
+            f"{count} {label}" for label, count in counts.items()
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s")
+        )
@@ -1,4 +1,84 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramWordSimilarity,
+)
 from django.db import models
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+
+from books.cache import invalidate_book, invalidate_books
+
+# Must match the configuration used by the search vector trigger
+SEARCH_CONFIG = "english"
+
+
+class BookQuerySet(models.QuerySet):
+    def search(self, text):
+        """
+        Full-text match on title/author, or fuzzy (trigram) match for
+        typos and partial words, annotated with a relevance `rank`.
+        """
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        similarity = Greatest(
+            TrigramWordSimilarity(text, "title"),
+            TrigramWordSimilarity(text, "author"),
+        )
+        return self.annotate(
+            rank=Cast(
+                SearchRank(F("search_vector"), query) + similarity,
+                FloatField(),
+            )
+        ).filter(
+            Q(search_vector=query)
+            | Q(title__trigram_word_similar=text)
+            | Q(author__trigram_word_similar=text)
+        )
+
+
+class BookManager(models.Manager.from_queryset(BookQuerySet)):
+    """Inventory is changed by single conditional UPDATEs"""
+
+    def decrement_inventory(self, book_id) -> bool:
+        """Take one copy of the book, return False if none is left"""
+        updated = self.filter(pk=book_id, inventory__gt=0).update(
+            inventory=F("inventory") - 1
+        )
+        if updated:
+            invalidate_book(book_id)
+        return bool(updated)
+
+    def increment_inventory(self, book_id) -> bool:
+        """Put one copy of the book back on the shelf"""
+        updated = self.filter(pk=book_id).update(
+            inventory=F("inventory") + 1
+        )
+        if updated:
+            invalidate_book(book_id)
+        return bool(updated)
+
+    def change_inventory(self, deltas) -> int:
+        """
+        Apply {book_id: delta} to several books in one UPDATE. The caller
+        must hold the rows' locks if a delta may take inventory below 0.
+        """
+        if not deltas:
+            return 0
+        updated = self.filter(pk__in=deltas).update(
+            inventory=F("inventory") + Case(
+                *(
+                    When(pk=book_id, then=Value(delta))
+                    for book_id, delta in deltas.items()
+                ),
+                default=Value(0),
+            )
+        )
+        invalidate_books(*deltas)
+        return updated
 
 
 class Book(models.Model):
@@ -11,6 +91,25 @@ class Book(models.Model):
     cover = models.CharField(max_length=10, choices=CoverChoices.choices)
     inventory = models.PositiveIntegerField(default=0)
     daily_fee = models.DecimalField(max_digits=5, decimal_places=2)
+    # maintained by the books_book_search_vector trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = BookManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="book_search_vector_idx"),
+            GinIndex(
+                fields=["title"],
+                name="book_title_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["author"],
+                name="book_author_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
@@ -1,11 +1,116 @@
+from decimal import Decimal, InvalidOperation
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
 
+from books.cache import (
+    CATALOGUE,
+    CachedCatalogueMixin,
+    book_version_name,
+)
 from books.models import Book
 from books.serializers import BookSerializer
 from books.permissions import IsAdminOrReadOnly
+from library.conditional import ConditionalGetMixin
+from library.metrics import SerializerMetricsMixin
+from library.pagination import RankedCursorPagination
+from library.routers import ReplicaReadMixin
+from library.rows import ValuesListMixin
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(
+    SerializerMetricsMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    CachedCatalogueMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet
+):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = (IsAdminOrReadOnly,)
+    pagination_class = RankedCursorPagination
+    version_names = (CATALOGUE,)
+
+    def get_version_names(self):
+        if self.action == "retrieve":
+            return (book_version_name(self.kwargs["pk"]),)
+        return self.version_names
+
+    @staticmethod
+    def _param_to_decimal(name, value):
+        """Converts a query parameter to a finite Decimal or raises a 400"""
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            number = None
+        if number is None or not number.is_finite():
+            raise ValidationError({name: "A valid number is required."})
+        return number
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if self.action != "list":
+            return queryset
+
+        query = self.request.query_params.get("q")
+        if query:
+            queryset = queryset.search(query)
+
+        cover = self.request.query_params.get("cover")
+        if cover:
+            queryset = queryset.filter(cover__iexact=cover)
+
+        in_stock = self.request.query_params.get("in_stock")
+        if in_stock:
+            if in_stock.lower() == "true":
+                queryset = queryset.filter(inventory__gt=0)
+            else:
+                queryset = queryset.filter(inventory=0)
+
+        for param, lookup in (
+            ("min_daily_fee", "daily_fee__gte"),
+            ("max_daily_fee", "daily_fee__lte"),
+        ):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(
+                    **{lookup: self._param_to_decimal(param, value)}
+                )
+
+        return queryset
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "q",
+                type=OpenApiTypes.STR,
+                description="Search by title and author, results are ranked "
+                            "by relevance (ex. ?q=tolkien hobbit)",
+            ),
+            OpenApiParameter(
+                "cover",
+                type=OpenApiTypes.STR,
+                description="Filter by cover (ex. ?cover=Hard)",
+            ),
+            OpenApiParameter(
+                "in_stock",
+                type=OpenApiTypes.BOOL,
+                description="Filter by availability (ex. ?in_stock=True)",
+            ),
+            OpenApiParameter(
+                "min_daily_fee",
+                type=OpenApiTypes.DECIMAL,
+                description="Minimal daily fee (ex. ?min_daily_fee=0.5)",
+            ),
+            OpenApiParameter(
+                "max_daily_fee",
+                type=OpenApiTypes.DECIMAL,
+                description="Maximal daily fee (ex. ?max_daily_fee=2)",
+            ),
+        ]
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
@@ -0,0 +1,181 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from books.models import Book
+from borrowings.cache import invalidate_borrowings
+from borrowings.models import Borrowing
+from borrowings.tasks import send_notification_task
+from payments.fines import settle_overdue_fines
+from payments.models import Payment
+from users.summary import change_summaries, change_summary
+
+DIGEST_MAX_LINES = 20
+
+
+def _rejected(key, item_id, error):
+    return {key: item_id, "status": "rejected", "error": error}
+
+
+def _borrow_digest(user, expected_return_date, titles):
+    lines = [
+        f":: {len(titles)} new borrowings ::",
+        f"borrow by: {user.email}",
+        f"return date: {expected_return_date}",
+    ]
+    lines += [f"book: {title}" for title in titles[:DIGEST_MAX_LINES]]
+    if len(titles) > DIGEST_MAX_LINES:
+        lines.append(f"... and {len(titles) - DIGEST_MAX_LINES} more")
+    return "\n".join(lines)
+
+
+def borrow_books(user, books, expected_return_date):
+    """
+    Borrow one copy per requested book id (an id may repeat). The books
+    are locked in id order, their inventory is taken in one UPDATE and
+    the borrowings are inserted in one statement. Returns a result per
+    requested id, in request order.
+    """
+    with transaction.atomic():
+        shelf = {
+            book_id: (title, inventory)
+            for book_id, title, inventory in (
+                Book.objects.select_for_update()
+                .filter(pk__in=set(books))
+                .order_by("id")
+                .values_list("id", "title", "inventory")
+            )
+        }
+        taken = Counter()
+        errors = []
+        for book_id in books:
+            if book_id not in shelf:
+                errors.append("Book not found")
+            elif shelf[book_id][1] <= taken[book_id]:
+                errors.append("Inventory: 0, you can`t borrow this book")
+            else:
+                taken[book_id] += 1
+                errors.append(None)
+
+        granted = [
+            book_id for book_id, error in zip(books, errors) if error is None
+        ]
+        Book.objects.change_inventory(
+            {book_id: -count for book_id, count in taken.items()}
+        )
+        borrowings = iter(
+            Borrowing.objects.bulk_create(
+                Borrowing(
+                    book_id=book_id,
+                    user=user,
+                    expected_return_date=expected_return_date,
+                )
+                for book_id in granted
+            )
+        )
+        if granted:
+            change_summary(user.id, active_borrowings=len(granted))
+            invalidate_borrowings(user.id)
+            message = _borrow_digest(
+                user,
+                expected_return_date,
+                [shelf[book_id][0] for book_id in granted],
+            )
+            transaction.on_commit(
+                lambda: send_notification_task.delay(message)
+            )
+
+    return [
+        {"book": book_id, "status": "borrowed",
+         "borrowing": next(borrowings).id}
+        if error is None
+        else _rejected("book", book_id, error)
+        for book_id, error in zip(books, errors)
+    ]
+
+
+def return_borrowings(borrowings, actual_return_date):
+    """
+    Return several borrowings at once: the borrowings are locked, marked
+    returned in one UPDATE and their copies go back to the shelf in
+    another; late returns get their fines completed. Returns a result
+    per requested id, in request order.
+    """
+    with transaction.atomic():
+        fined = Payment.objects.filter(
+            borrowing=OuterRef("pk"), type=Payment.TypeChoices.FINE
+        )
+        found = {
+            borrowing_id: (
+                borrow_date, expected, returned, book_id, user_id, is_fined
+            )
+            for (
+                borrowing_id, borrow_date, expected, returned, book_id,
+                user_id, is_fined,
+            ) in (
+                Borrowing.objects.select_for_update()
+                .filter(pk__in=set(borrowings))
+                .order_by("id")
+                .values_list(
+                    "id",
+                    "borrow_date",
+                    "expected_return_date",
+                    "actual_return_date",
+                    "book_id",
+                    "user_id",
+                    Exists(fined),
+                )
+            )
+        }
+        returning = {}
+        late = []
+        results = []
+        for borrowing_id in borrowings:
+            if borrowing_id not in found:
+                results.append(
+                    _rejected("borrowing", borrowing_id, "Not found.")
+                )
+                continue
+            borrow_date, expected, returned, book_id, user_id, is_fined = (
+                found[borrowing_id]
+            )
+            if returned or borrowing_id in returning:
+                results.append(_rejected(
+                    "borrowing", borrowing_id, "Borrowing was already returned"
+                ))
+                continue
+            try:
+                Borrowing.validate_dates(
+                    borrow_date, actual_return_date, ValidationError
+                )
+            except ValidationError as error:
+                results.append(
+                    _rejected("borrowing", borrowing_id, error.detail[0])
+                )
+                continue
+            returning[borrowing_id] = (book_id, user_id, is_fined)
+            if actual_return_date > expected:
+                late.append(borrowing_id)
+            results.append({"borrowing": borrowing_id, "status": "returned"})
+
+        if returning:
+            Borrowing.objects.filter(pk__in=returning).update(
+                actual_return_date=actual_return_date
+            )
+            Book.objects.change_inventory(
+                Counter(book_id for book_id, _, _ in returning.values())
+            )
+            changes = {}
+            for _, user_id, is_fined in returning.values():
+                deltas = changes.setdefault(
+                    user_id, {"active_borrowings": 0, "overdue_borrowings": 0}
+                )
+                deltas["active_borrowings"] -= 1
+                deltas["overdue_borrowings"] -= is_fined
+            change_summaries(changes)
+            if late:
+                settle_overdue_fines(late)
+            invalidate_borrowings(*changes)
+    return results
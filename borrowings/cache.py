@@ -0,0 +1,20 @@
+from library.cache import invalidate
+from library.routers import pin_to_primary
+
+ALL_BORROWINGS = "borrowings:all"
+
+
+def user_borrowings_version_name(user_id):
+    return f"borrowings:user:{user_id}"
+
+
+def invalidate_borrowings(*user_ids):
+    """
+    Mark the users' and the admins' borrowing lists as changed and keep
+    the users' reads off the replicas until they have the change
+    """
+    invalidate(
+        ALL_BORROWINGS,
+        *(user_borrowings_version_name(user_id) for user_id in user_ids)
+    )
+    pin_to_primary(*user_ids)
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0003_borrowing_overdue_idx"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="borrowing",
+            constraint=models.CheckConstraint(
+                check=models.Q(("expected_return_date__gte", models.F("borrow_date"))),
+                name="borrowing_expected_return_after_borrow",
+            ),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F, Q
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
@@ -18,9 +19,38 @@ class Borrowing(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name="borrowings"
+        related_name="borrowings",
+        db_index=False,
     )
 
+    class Meta:
+        indexes = [
+            # per-user history, newest first (also covers user_id lookups)
+            models.Index(fields=["user", "-id"], name="borrowing_user_idx"),
+            models.Index(
+                fields=["user", "-id"],
+                name="borrowing_user_active_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+            models.Index(
+                fields=["-id"],
+                name="borrowing_active_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+            # incremental overdue sweep
+            models.Index(
+                fields=["expected_return_date"],
+                name="borrowing_overdue_idx",
+                condition=Q(actual_return_date__isnull=True),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(expected_return_date__gte=F("borrow_date")),
+                name="borrowing_expected_return_after_borrow",
+            ),
+        ]
+
     @staticmethod
     def validate_dates(borrow_date, return_date, error_to_raise):
         if borrow_date > return_date:
@@ -29,13 +59,6 @@ class Borrowing(models.Model):
                 f"{borrow_date} > {return_date}"
             )
 
-    @staticmethod
-    def validate_inventory(book, error_to_raise):
-        if not book.inventory > 0:
-            raise error_to_raise(
-                "Inventory: 0, you can`t borrow this book"
-            )
-
     def clean(self):
         borrow_date = self.borrow_date
         if not borrow_date:
@@ -56,7 +79,15 @@ class Borrowing(models.Model):
             using=None,
             update_fields=None,
     ):
-        self.full_clean()
+        # only the field values and date invariants; foreign keys already
+        # loaded on the instance don't need an existence SELECT each
+        loaded_relations = [
+            field.name
+            for field in self._meta.concrete_fields
+            if field.is_relation and field.is_cached(self)
+        ]
+        self.clean_fields(exclude=loaded_relations)
+        self.clean()
         return super(Borrowing, self).save(
             force_insert, force_update, using, update_fields
         )
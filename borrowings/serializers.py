@@ -2,9 +2,16 @@ from rest_framework import serializers
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Case, Exists, IntegerField, When
 
 from borrowings.models import Borrowing
+from books.models import Book
 from books.serializers import BookSerializer
+from payments.fines import settle_overdue_fines
+from payments.models import Payment
+from users.summary import change_summary, tracked_writes
+
+BULK_MAX_ITEMS = 100
 
 
 class BorrowingSerializer(serializers.ModelSerializer):
@@ -15,7 +22,7 @@ class BorrowingSerializer(serializers.ModelSerializer):
             borrow_date = data["borrow_date"]
         dates = (
             data["expected_return_date"],
-            data["actual_return_date"]
+            data.get("actual_return_date")
         )
         for return_date in dates:
             if return_date:
@@ -49,13 +56,16 @@ class BorrowingCreateSerializer(BorrowingSerializer):
     def create(self, validated_data):
         with transaction.atomic():
             book = validated_data["book"]
-            Borrowing.validate_inventory(
-                validated_data["book"],
-                ValidationError
-            )
+            if not Book.objects.decrement_inventory(book.id):
+                raise ValidationError(
+                    "Inventory: 0, you can`t borrow this book"
+                )
+            # keep the loaded instance in step for the notification
             book.inventory -= 1
-            book.save()
-            return Borrowing.objects.create(**validated_data)
+            with tracked_writes():
+                borrowing = Borrowing.objects.create(**validated_data)
+            change_summary(borrowing.user_id, active_borrowings=1)
+            return borrowing
 
     class Meta:
         model = Borrowing
@@ -73,6 +83,52 @@ class BorrowingReturnSerializer(BorrowingSerializer):
         )
         return data
 
+    def update(self, instance, validated_data):
+        instance.actual_return_date = validated_data["actual_return_date"]
+        with tracked_writes():
+            instance.save(update_fields=["actual_return_date"])
+        fined = Payment.objects.filter(
+            borrowing=instance, type=Payment.TypeChoices.FINE
+        )
+        change_summary(
+            instance.user_id,
+            active_borrowings=-1,
+            overdue_borrowings=Case(
+                When(Exists(fined), then=-1),
+                default=0,
+                output_field=IntegerField(),
+            ),
+        )
+        if instance.actual_return_date > instance.expected_return_date:
+            settle_overdue_fines([instance.id])
+        return instance
+
     class Meta:
         model = Borrowing
         fields = ("id", "actual_return_date")
+
+
+class BorrowingBulkCreateSerializer(serializers.Serializer):
+    books = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=BULK_MAX_ITEMS,
+    )
+    expected_return_date = serializers.DateField()
+
+    def validate_expected_return_date(self, value):
+        Borrowing.validate_dates(
+            timezone.now().date(), value, ValidationError
+        )
+        return value
+
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    borrowings = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=BULK_MAX_ITEMS,
+    )
+    actual_return_date = serializers.DateField(
+        default=lambda: timezone.now().date()
+    )
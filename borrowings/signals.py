@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from borrowings.cache import invalidate_borrowings
 from borrowings.models import Borrowing
-from borrowings.telegram_actions import send_notification
+from borrowings.tasks import send_notification_task
+from users.summary import forget_summaries, writes_tracked
 
 
 @receiver(post_save, sender=Borrowing)
@@ -14,4 +17,28 @@ def notify_borrowing_creation(sender, instance, created, **kwargs):
                    f"borrow by: {instance.user.email}\n"
                    f"return date: {instance.expected_return_date}\n"
                    f"books left: {instance.book.inventory}")
-        send_notification(message)
+        transaction.on_commit(lambda: send_notification_task.delay(message))
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_cached_borrowings(sender, instance, **kwargs):
+    invalidate_borrowings(instance.user_id)
+
+
+@receiver(post_delete, sender=Borrowing)
+def forget_borrower_summary(sender, instance, **kwargs):
+    forget_summaries(instance.user_id)
+
+
+@receiver(pre_save, sender=Borrowing)
+def forget_untracked_borrower_summary(sender, instance, **kwargs):
+    if writes_tracked():
+        return
+    user_ids = [instance.user_id]
+    if instance.pk:
+        # the previous borrower, if the borrowing is moved
+        user_ids += Borrowing.objects.filter(pk=instance.pk).values_list(
+            "user_id", flat=True
+        )
+    forget_summaries(*user_ids)
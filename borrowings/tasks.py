@@ -1,8 +1,27 @@
 from celery import shared_task
+from django.conf import settings
 
-from borrowings.telegram_actions import send_notification
+from borrowings.telegram_actions import (
+    CHAT_ID,
+    buffer_notification,
+    flush_notifications,
+    seconds_until_flush,
+    send_notification,
+)
 
 
 @shared_task
 def send_notification_task(message: str):
-    send_notification(message)
+    if not settings.TELEGRAM_NOTIFICATION_WINDOW:
+        send_notification(message)
+        return
+    window_id = buffer_notification(message)
+    if window_id is not None:
+        flush_notifications_task.apply_async(
+            (window_id, CHAT_ID), countdown=seconds_until_flush(window_id)
+        )
+
+
+@shared_task
+def flush_notifications_task(window_id: int, chat_id: str):
+    return flush_notifications(window_id, chat_id)
@@ -1,6 +1,9 @@
 import os
-import telebot
+import time
 
+import telebot
+from django.conf import settings
+from django.core.cache import cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,8 +11,69 @@ load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+MESSAGE_MAX_LENGTH = 4096
+BATCH_SEPARATOR = "\n\n"
+BATCH_TTL = 60 * 60
+FLUSH_GRACE_SECONDS = 1
+
 bot = telebot.TeleBot(BOT_TOKEN)
 
 
-def send_notification(message):
-    bot.send_message(CHAT_ID, message)
+def send_notification(message, chat_id=CHAT_ID):
+    bot.send_message(chat_id, message)
+
+
+def _batch_key(chat_id, window_id):
+    return f"telegram:batch:{chat_id}:{window_id}"
+
+
+def buffer_notification(message, chat_id=CHAT_ID):
+    """
+    Append a message to the chat's batch for the current time window.
+    Returns the window id if this message opened the batch (the caller
+    must schedule its flush), otherwise None.
+    """
+    window_id = int(time.time() // settings.TELEGRAM_NOTIFICATION_WINDOW)
+    key = _batch_key(chat_id, window_id)
+    cache.add(f"{key}:size", 0, timeout=BATCH_TTL)
+    position = cache.incr(f"{key}:size")
+    cache.set(f"{key}:{position}", message, timeout=BATCH_TTL)
+    return window_id if position == 1 else None
+
+
+def seconds_until_flush(window_id):
+    window_end = (window_id + 1) * settings.TELEGRAM_NOTIFICATION_WINDOW
+    return max(window_end - time.time(), 0) + FLUSH_GRACE_SECONDS
+
+
+def join_messages(messages):
+    """Join messages into as few Telegram-sized chunks as possible"""
+    chunks = []
+    current = ""
+    for message in messages:
+        candidate = f"{current}{BATCH_SEPARATOR}{message}"
+        if current and len(candidate) <= MESSAGE_MAX_LENGTH:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        while len(message) > MESSAGE_MAX_LENGTH:
+            chunks.append(message[:MESSAGE_MAX_LENGTH])
+            message = message[MESSAGE_MAX_LENGTH:]
+        current = message
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def flush_notifications(window_id, chat_id=CHAT_ID):
+    """Send every message buffered for the window in a single batch"""
+    key = _batch_key(chat_id, window_id)
+    size = cache.get(f"{key}:size", 0)
+    keys = [f"{key}:{position}" for position in range(1, size + 1)]
+    buffered = cache.get_many(keys)
+    messages = [buffered[key] for key in keys if key in buffered]
+    for chunk in join_messages(messages):
+        send_notification(chunk, chat_id)
+    cache.delete_many(keys + [f"{key}:size"])
+    return len(messages)
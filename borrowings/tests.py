@@ -1,14 +1,37 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, IntegrityError
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 
 from books.models import Book
 from books.serializers import BookSerializer
 from books.tests import sample_book
 from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingListSerializer
+from borrowings.tasks import send_notification_task
+from library.routers import ReplicaRouter, replica_reads_enabled
+from library.testing import QueryScalingMixin
+from users.authentication import AccessToken
+from users.summary import create_summaries
+from borrowings.telegram_actions import (
+    MESSAGE_MAX_LENGTH,
+    flush_notifications,
+    join_messages,
+)
 
 
 def sample_borrowing():
@@ -28,6 +51,11 @@ def get_borrowing_list_url():
     return reverse("borrowings:borrowing-list")
 
 
+EXPORT_URL = reverse("borrowings:borrowing-export")
+BULK_BORROW_URL = reverse("borrowings:borrowing-bulk-borrow")
+BULK_RETURN_URL = reverse("borrowings:borrowing-bulk-return")
+
+
 def get_borrowing_return_url(pk: int):
     return reverse(
         "borrowings:borrowing-return-borrowing",
@@ -139,26 +167,28 @@ class BorrowingAuthorizedFilteringViewSetTests(TestCase):
 
     def test_get_borrowings_for_user(self):
         res = self.client.get(get_borrowing_list_url())
-        self.assertEqual(1, len(res.data))
+        self.assertEqual(1, len(res.data["results"]))
 
     def test_get_borrowings_for_admin(self):
         self.client.force_authenticate(self.other_user)
         res = self.client.get(get_borrowing_list_url())
-        self.assertEqual(2, len(res.data))
+        self.assertEqual(2, len(res.data["results"]))
 
     def test_get_borrowings_with_is_active_filter(self):
         self.client.force_authenticate(self.other_user)
         res = self.client.get(get_borrowing_list_url() + "?is_active=True")
-        self.assertEqual(1, len(res.data))
+        self.assertEqual(1, len(res.data["results"]))
 
     def test_get_borrowings_with_user_id_filter_as_user(self):
         res = self.client.get(get_borrowing_list_url() + "?user_id=2")
-        self.assertEqual(1, len(res.data))
+        self.assertEqual(1, len(res.data["results"]))
 
     def test_get_borrowings_with_user_id_filter_as_admin(self):
         self.client.force_authenticate(self.other_user)
-        res = self.client.get(get_borrowing_list_url() + "?user_id=1")
-        self.assertEqual(1, len(res.data))
+        res = self.client.get(
+            get_borrowing_list_url() + f"?user_id={self.user.id}"
+        )
+        self.assertEqual(1, len(res.data["results"]))
 
 
 class BorrowingReturnTests(TestCase):
@@ -179,25 +209,26 @@ class BorrowingReturnTests(TestCase):
         borrowings["book"] = Book.objects.get(title="test")
         borrowings["user"] = self.user
         borrowings.pop("actual_return_date")
-        Borrowing.objects.create(**borrowings)
+        self.borrowing = Borrowing.objects.create(**borrowings)
 
     def test_borrowing_return(self):
         return_date = timezone.now().date() + timezone.timedelta(days=10)
         res = self.client.post(
-            get_borrowing_return_url(1),
+            get_borrowing_return_url(self.borrowing.id),
             data={
                 "actual_return_date": return_date
             }
         )
         self.assertEqual(status.HTTP_200_OK, res.status_code)
         self.assertEqual(str(return_date), res.data["actual_return_date"])
+        self.assertEqual(3, Book.objects.get(title="test").inventory)
 
     def test_borrowing_return_twice(self):
         return_date = timezone.now().date() + timezone.timedelta(days=10)
         res = None
         for _ in range(2):
             res = self.client.post(
-                get_borrowing_return_url(1),
+                get_borrowing_return_url(self.borrowing.id),
                 data={
                     "actual_return_date": return_date
                 }
@@ -211,9 +242,744 @@ class BorrowingReturnTests(TestCase):
         self.client.force_authenticate(other_user)
         return_date = timezone.now().date() + timezone.timedelta(days=10)
         res = self.client.post(
-            get_borrowing_return_url(1),
+            get_borrowing_return_url(self.borrowing.id),
             data={
                 "actual_return_date": return_date
             }
         )
         self.assertEqual(status.HTTP_403_FORBIDDEN, res.status_code)
+
+
+@override_settings(TELEGRAM_NOTIFICATION_WINDOW=3600)
+class BorrowingNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.book = Book.objects.create(
+            title="test", author="author", cover="Hard",
+            inventory=2, daily_fee=1
+        )
+
+    def create_borrowing(self):
+        borrowing = sample_borrowing()
+        borrowing.pop("actual_return_date")
+        borrowing["book"] = self.book
+        borrowing["user"] = self.user
+        return Borrowing.objects.create(**borrowing)
+
+    @patch("borrowings.signals.send_notification_task.delay")
+    def test_notification_enqueued_after_commit(self, mock_delay):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_borrowing()
+            mock_delay.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        mock_delay.assert_called_once()
+        self.assertIn("book: test", mock_delay.call_args.args[0])
+
+    @patch("borrowings.telegram_actions.bot.send_message")
+    @patch("borrowings.tasks.flush_notifications_task.apply_async")
+    def test_notifications_batched_per_window(self, mock_flush, mock_send):
+        for i in range(3):
+            send_notification_task(f"message {i}")
+        mock_send.assert_not_called()
+        mock_flush.assert_called_once()
+
+        window_id, chat_id = mock_flush.call_args.args[0]
+        self.assertEqual(3, flush_notifications(window_id, chat_id))
+        mock_send.assert_called_once_with(
+            chat_id, "message 0\n\nmessage 1\n\nmessage 2"
+        )
+
+    def test_join_messages_respects_telegram_limit(self):
+        messages = ["a" * 3000, "b" * 3000, "c" * 5000]
+        chunks = join_messages(messages)
+        self.assertEqual(["a" * 3000, "b" * 3000], chunks[:2])
+        self.assertTrue(all(len(c) <= MESSAGE_MAX_LENGTH for c in chunks))
+        self.assertEqual("".join(messages), "".join(chunks))
+
+
+class BorrowingQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"user{i}@test.com") for i in range(50)
+        )
+        book = Book.objects.create(
+            title="test", author="author", cover="Hard",
+            inventory=1, daily_fee=1
+        )
+        today = timezone.now().date()
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                book=book,
+                user=user,
+                borrow_date=today,
+                expected_return_date=today,
+                actual_return_date=None if i % 20 == 0 else today,
+            )
+            for user in users
+            for i in range(200)
+        )
+        cls.user = users[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE borrowings_borrowing")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f"Index Scan using {index_name}", plan)
+
+    def test_user_history_uses_index(self):
+        queryset = Borrowing.objects.select_related("book", "user").filter(
+            user=self.user
+        )
+        self.assertUsesIndex(
+            queryset.order_by("-id")[:51], "borrowing_user_idx"
+        )
+
+    def test_user_active_borrowings_use_partial_index(self):
+        queryset = Borrowing.objects.select_related("book", "user").filter(
+            user=self.user, actual_return_date__isnull=True
+        )
+        self.assertUsesIndex(
+            queryset.order_by("-id")[:51], "borrowing_user_active_idx"
+        )
+
+    def test_active_borrowings_use_partial_index(self):
+        queryset = Borrowing.objects.select_related("book", "user").filter(
+            actual_return_date__isnull=True
+        )
+        self.assertUsesIndex(
+            queryset.order_by("-id")[:51], "borrowing_active_idx"
+        )
+
+
+class BorrowingConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.other_user = get_user_model().objects.create_user(
+            "other@test.com", "password"
+        )
+        self.book = Book.objects.create(
+            title="test", author="author", cover="Hard",
+            inventory=5, daily_fee=1
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_borrowing(self, user):
+        borrowing = sample_borrowing()
+        borrowing.pop("actual_return_date")
+        borrowing["book"] = self.book
+        borrowing["user"] = user
+        return Borrowing.objects.create(**borrowing)
+
+    def test_unchanged_list_returns_304_without_serializing(self):
+        self.create_borrowing(self.user)
+        res = self.client.get(get_borrowing_list_url())
+        self.assertEqual("private", res["Cache-Control"])
+        self.assertIn("Authorize", res["Vary"])
+
+        with patch.object(BorrowingListSerializer, "to_representation") as m:
+            res = self.client.get(
+                get_borrowing_list_url(), HTTP_IF_NONE_MATCH=res["ETag"]
+            )
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, res.status_code)
+        m.assert_not_called()
+
+    def test_other_users_borrowing_keeps_etag(self):
+        self.create_borrowing(self.user)
+        etag = self.client.get(get_borrowing_list_url())["ETag"]
+
+        other_client = APIClient()
+        other_client.force_authenticate(self.other_user)
+        borrowing = sample_borrowing()
+        borrowing["book"] = self.book.id
+        res = other_client.post(get_borrowing_list_url(), data=borrowing)
+        self.assertEqual(status.HTTP_201_CREATED, res.status_code)
+        self.assertEqual(4, Book.objects.get(id=self.book.id).inventory)
+
+        res = self.client.get(
+            get_borrowing_list_url(), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, res.status_code)
+
+    def test_book_edit_changes_etag(self):
+        self.create_borrowing(self.user)
+        etag = self.client.get(get_borrowing_list_url())["ETag"]
+        self.book.title = "renamed"
+        self.book.save()
+        res = self.client.get(
+            get_borrowing_list_url(), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertEqual("renamed", res.data["results"][0]["book_title"])
+
+    def test_if_none_match_any_needs_existing_borrowing(self):
+        own = self.create_borrowing(self.user)
+        other = self.create_borrowing(self.other_user)
+        for borrowing, expected in (
+            (own, status.HTTP_304_NOT_MODIFIED),
+            (other, status.HTTP_404_NOT_FOUND),
+        ):
+            res = self.client.get(
+                reverse(
+                    "borrowings:borrowing-detail",
+                    kwargs={"pk": borrowing.id},
+                ),
+                HTTP_IF_NONE_MATCH="*",
+            )
+            self.assertEqual(expected, res.status_code)
+
+    def test_own_changes_change_etag(self):
+        etag = self.client.get(get_borrowing_list_url())["ETag"]
+        self.create_borrowing(self.user)
+        res = self.client.get(
+            get_borrowing_list_url(), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertEqual(1, len(res.data["results"]))
+
+    def test_etag_differs_between_users(self):
+        etag = self.client.get(get_borrowing_list_url())["ETag"]
+        self.client.force_authenticate(self.other_user)
+        res = self.client.get(
+            get_borrowing_list_url(), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+
+class BorrowingQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(**{**sample_book(), "inventory": 2})
+        create_summaries(self.user.id)
+
+    def create_borrowing(self):
+        data = sample_borrowing()
+        data["book"] = self.book.id
+        with patch("borrowings.signals.send_notification_task.delay"):
+            return self.client.post(get_borrowing_list_url(), data)
+
+    def test_create_queries(self):
+        # book lookup, savepoint, inventory update, insert, summary
+        # update, release
+        with self.assertNumQueries(6):
+            res = self.create_borrowing()
+        self.assertEqual(status.HTTP_201_CREATED, res.status_code)
+
+    def test_return_queries(self):
+        borrowing_id = self.create_borrowing().data["id"]
+        return_date = sample_borrowing()["expected_return_date"]
+        # savepoint, locked select, borrowing update, summary update,
+        # inventory update, release
+        with self.assertNumQueries(6):
+            res = self.client.post(
+                get_borrowing_return_url(borrowing_id),
+                data={"actual_return_date": return_date},
+            )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+    def test_save_still_validates_dates(self):
+        today = timezone.now().date()
+        with self.assertRaises(ValidationError):
+            Borrowing.objects.create(
+                borrow_date=today,
+                expected_return_date=today - timezone.timedelta(days=1),
+                book=self.book,
+                user=self.user,
+            )
+
+    def test_dates_enforced_by_database(self):
+        borrowing_id = self.create_borrowing().data["id"]
+        with self.assertRaises(IntegrityError):
+            Borrowing.objects.filter(id=borrowing_id).update(
+                expected_return_date=F("borrow_date") - 1
+            )
+
+
+class BorrowingBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.today = timezone.now().date()
+        self.books = Book.objects.bulk_create(
+            Book(**{**sample_book(), "title": f"book {i}", "inventory": 2})
+            for i in range(50)
+        )
+        create_summaries(self.user.id)
+
+    def bulk_borrow(self, book_ids):
+        with patch("borrowings.bulk.send_notification_task.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    BULK_BORROW_URL,
+                    {
+                        "books": book_ids,
+                        "expected_return_date": str(
+                            self.today + timezone.timedelta(days=7)
+                        ),
+                    },
+                    format="json",
+                )
+        self.notify = delay
+        return res
+
+    def bulk_return(self, borrowing_ids, **data):
+        return self.client.post(
+            BULK_RETURN_URL,
+            {"borrowings": borrowing_ids, **data},
+            format="json",
+        )
+
+    def test_bulk_borrow_queries_constant(self):
+        book_ids = [book.id for book in self.books]
+        # savepoint, lock books, inventory update, insert, summary
+        # update, release
+        with self.assertNumQueries(6):
+            res = self.bulk_borrow(book_ids)
+
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertEqual(50, Borrowing.objects.filter(user=self.user).count())
+        self.assertEqual(
+            {1}, set(Book.objects.values_list("inventory", flat=True))
+        )
+        self.notify.assert_called_once()
+        self.assertIn("50 new borrowings", self.notify.call_args.args[0])
+
+    def test_bulk_borrow_per_item_results(self):
+        book = self.books[0]
+        res = self.bulk_borrow([book.id, 0, book.id, book.id])
+
+        self.assertEqual(
+            ["borrowed", "rejected", "borrowed", "rejected"],
+            [result["status"] for result in res.data],
+        )
+        self.assertEqual("Book not found", res.data[1]["error"])
+        self.assertIn("Inventory: 0", res.data[3]["error"])
+        self.assertEqual(0, Book.objects.get(id=book.id).inventory)
+        self.assertEqual(
+            {res.data[0]["borrowing"], res.data[2]["borrowing"]},
+            set(Borrowing.objects.values_list("id", flat=True)),
+        )
+
+    def test_bulk_borrow_nothing_available(self):
+        res = self.bulk_borrow([0])
+        self.assertEqual("rejected", res.data[0]["status"])
+        self.notify.assert_not_called()
+
+    def test_bulk_borrow_validates_dates(self):
+        res = self.client.post(
+            BULK_BORROW_URL,
+            {
+                "books": [self.books[0].id],
+                "expected_return_date": str(
+                    self.today - timezone.timedelta(days=1)
+                ),
+            },
+            format="json",
+        )
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, res.status_code)
+
+    def test_bulk_return_queries_constant(self):
+        res = self.bulk_borrow([book.id for book in self.books])
+        borrowing_ids = [result["borrowing"] for result in res.data]
+
+        # savepoint, lock borrowings, borrowing update, summary update,
+        # inventory update, release
+        with self.assertNumQueries(6):
+            res = self.bulk_return(borrowing_ids)
+
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertFalse(
+            Borrowing.objects.filter(actual_return_date__isnull=True).exists()
+        )
+        self.assertEqual(
+            {2}, set(Book.objects.values_list("inventory", flat=True))
+        )
+
+    def test_bulk_return_per_item_results(self):
+        res = self.bulk_borrow([self.books[0].id, self.books[1].id])
+        first, second = [result["borrowing"] for result in res.data]
+        self.bulk_return([second])
+
+        res = self.bulk_return([first, first, second, 0])
+
+        self.assertEqual(
+            ["returned", "rejected", "rejected", "rejected"],
+            [result["status"] for result in res.data],
+        )
+        self.assertEqual(
+            "Borrowing was already returned", res.data[1]["error"]
+        )
+        self.assertEqual(2, Book.objects.get(id=self.books[0].id).inventory)
+
+    def test_bulk_return_before_borrow_date_rejected(self):
+        res = self.bulk_borrow([self.books[0].id])
+        borrowing_id = res.data[0]["borrowing"]
+
+        res = self.bulk_return(
+            [borrowing_id],
+            actual_return_date=str(self.today - timezone.timedelta(days=1)),
+        )
+
+        self.assertEqual("rejected", res.data[0]["status"])
+        self.assertEqual(1, Book.objects.get(id=self.books[0].id).inventory)
+
+    def test_bulk_return_admin_only(self):
+        other_user = get_user_model().objects.create_user(
+            "user2@test.com", "password"
+        )
+        self.client.force_authenticate(other_user)
+        res = self.bulk_return([1])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, res.status_code)
+
+
+class BorrowingQueryScalingTests(QueryScalingMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(
+            **{**sample_book(), "inventory": 1000}
+        )
+        self.borrowing = Borrowing.objects.create(
+            expected_return_date=timezone.now().date(),
+            book=self.book,
+            user=self.user,
+        )
+        create_summaries(self.user.id)
+        self.seeded = 0
+
+    def seed_borrowings(self, count):
+        """Each borrowing gets its own book and user"""
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f"reader{self.seeded + i}@test.com")
+            for i in range(count)
+        )
+        books = Book.objects.bulk_create(
+            Book(**{**sample_book(), "title": f"book {self.seeded + i}"})
+            for i in range(count)
+        )
+        self.seeded += count
+        today = timezone.now().date()
+        Borrowing.objects.bulk_create(
+            [
+                Borrowing(borrow_date=today, expected_return_date=today,
+                          book=book, user=reader)
+                for book, reader in zip(books, users)
+            ]
+            + [
+                Borrowing(borrow_date=today, expected_return_date=today,
+                          book=book, user=self.user)
+                for book in books
+            ]
+        )
+
+    def test_list_as_user(self):
+        self.assertQueriesConstant(
+            self.seed_borrowings,
+            lambda: self.client.get(get_borrowing_list_url()),
+        )
+
+    def test_list_as_admin(self):
+        self.client.force_authenticate(self.admin)
+        self.assertQueriesConstant(
+            self.seed_borrowings,
+            lambda: self.client.get(get_borrowing_list_url()),
+        )
+
+    def test_retrieve(self):
+        url = reverse(
+            "borrowings:borrowing-detail", kwargs={"pk": self.borrowing.id}
+        )
+        self.assertQueriesConstant(
+            self.seed_borrowings, lambda: self.client.get(url)
+        )
+
+    @patch("borrowings.signals.send_notification_task.delay")
+    def test_create(self, mock_delay):
+        data = sample_borrowing()
+        data["book"] = self.book.id
+        self.assertQueriesConstant(
+            self.seed_borrowings,
+            lambda: self.client.post(get_borrowing_list_url(), data),
+        )
+
+    def test_return(self):
+        self.client.force_authenticate(self.admin)
+        active = iter([
+            Borrowing.objects.create(
+                expected_return_date=timezone.now().date(),
+                book=self.book,
+                user=self.user,
+            )
+            for _ in range(2)
+        ])
+        # created outside the tracked paths, which forgets the summary
+        create_summaries(self.user.id)
+        self.assertQueriesConstant(
+            self.seed_borrowings,
+            lambda: self.client.post(
+                get_borrowing_return_url(next(active).id),
+                {"actual_return_date": timezone.now().date()},
+            ),
+        )
+
+
+class BorrowingExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.admin)
+        book = Book.objects.create(**{**sample_book(), "title": "Ünïcode"})
+        today = timezone.now().date()
+        self.active = Borrowing.objects.create(
+            borrow_date=today, expected_return_date=today,
+            book=book, user=self.user,
+        )
+        self.returned = Borrowing.objects.create(
+            borrow_date=today, expected_return_date=today,
+            actual_return_date=today, book=book, user=self.admin,
+        )
+
+    def export(self, **params):
+        res = self.client.get(EXPORT_URL, params)
+        self.assertTrue(res.streaming)
+        return res, b"".join(res.streaming_content).decode()
+
+    def test_csv(self):
+        res, body = self.export()
+
+        self.assertEqual("text/csv; charset=utf-8", res["Content-Type"])
+        self.assertIn("borrowings.csv", res["Content-Disposition"])
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(
+            ["id", "borrow_date", "expected_return_date",
+             "actual_return_date", "book", "book_title", "user",
+             "user_email"],
+            rows[0],
+        )
+        self.assertEqual(
+            [str(self.active.id), str(self.returned.id)],
+            [row[0] for row in rows[1:]],
+        )
+        self.assertEqual("Ünïcode", rows[1][5])
+        self.assertEqual("", rows[1][3])
+
+    def test_ndjson(self):
+        res, body = self.export(output="ndjson")
+
+        self.assertEqual("application/x-ndjson", res["Content-Type"])
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(2, len(rows))
+        self.assertEqual(
+            {
+                "id": self.returned.id,
+                "borrow_date": str(self.returned.borrow_date),
+                "expected_return_date": str(self.returned.borrow_date),
+                "actual_return_date": str(self.returned.borrow_date),
+                "book": self.returned.book_id,
+                "book_title": "Ünïcode",
+                "user": self.admin.id,
+                "user_email": "admin@test.com",
+            },
+            rows[1],
+        )
+
+    def test_filters(self):
+        _, body = self.export(output="ndjson", is_active="True")
+        self.assertEqual(
+            [self.active.id],
+            [json.loads(line)["id"] for line in body.splitlines()],
+        )
+
+        _, body = self.export(output="ndjson", user_id=str(self.admin.id))
+        self.assertEqual(
+            [self.returned.id],
+            [json.loads(line)["id"] for line in body.splitlines()],
+        )
+
+    @patch("borrowings.views.EXPORT_CHUNK_SIZE", 1)
+    def test_rows_paged_by_keyset(self):
+        with CaptureQueriesContext(connection) as context:
+            _, body = self.export(output="ndjson")
+
+        self.assertEqual(2, len(body.splitlines()))
+        # a page per row, then an empty one; no server-side cursor
+        queries = [query["sql"] for query in context.captured_queries]
+        self.assertEqual(3, len(queries))
+        self.assertIn(
+            f'"borrowings_borrowing"."id" > {self.active.id}', queries[1]
+        )
+
+    async def asgi_export(self, on_body):
+        """
+        GETs the export through the ASGI handler, awaiting on_body(body)
+        for every body message as it is sent; the test database
+        connection is kept open like the async test client does
+        """
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": EXPORT_URL,
+            "query_string": b"",
+            "server": ("testserver", 80),
+            "headers": [
+                (b"host", b"testserver"),
+                (b"authorize",
+                 f"Bearer {AccessToken.for_user(self.admin)}".encode()),
+            ],
+        }
+        requests = [{"type": "http.request", "body": b""}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                await on_body(message.get("body", b""))
+
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+        try:
+            await ASGIHandler()(scope, receive, send)
+        finally:
+            for signal in (request_started, request_finished):
+                signal.connect(close_old_connections)
+
+    @patch("borrowings.views.EXPORT_CHUNK_SIZE", 1)
+    async def test_streamed_chunk_by_chunk_under_asgi(self):
+        bodies, added = [], []
+
+        async def on_body(body):
+            if not bodies:
+                # rows are read as the body goes out, so a borrowing
+                # added once the header is sent is still exported
+                added.append(await Borrowing.objects.acreate(
+                    borrow_date=self.active.borrow_date,
+                    expected_return_date=self.active.borrow_date,
+                    book_id=self.active.book_id,
+                    user=self.user,
+                ))
+            bodies.append(body)
+
+        await self.asgi_export(on_body)
+
+        parts = [body.decode() for body in bodies if body]
+        self.assertTrue(parts[0].startswith("id,borrow_date"))
+        self.assertEqual(
+            [self.active.id, self.returned.id, added[0].id],
+            [int(part.split(",")[0]) for part in parts[1:]],
+        )
+
+    def test_unknown_output_rejected(self):
+        res = self.client.get(EXPORT_URL, {"output": "xml"})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, res.status_code)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.user)
+        res = self.client.get(EXPORT_URL)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, res.status_code)
+
+
+@override_settings(REPLICA_DATABASES=["replica"])
+class BorrowingReplicaReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(**{**sample_book(), "inventory": 1})
+
+    def replica_reads(self, url):
+        """Whether the GET request's reads were sent to a replica"""
+        routed = []
+
+        def db_for_read(router, model, **hints):
+            routed.append(replica_reads_enabled())
+
+        with patch.object(ReplicaRouter, "db_for_read", db_for_read):
+            res = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        return any(routed)
+
+    def settled(self):
+        """As if every change had had time to replicate"""
+        return override_settings(REPLICA_STICKY_SECONDS=0)
+
+    def test_list_reads_from_replica_until_user_writes(self):
+        with self.settled():
+            self.assertTrue(self.replica_reads(get_borrowing_list_url()))
+
+        res = self.client.post(get_borrowing_list_url(), {
+            "book": self.book.id,
+            "expected_return_date": sample_borrowing()["expected_return_date"],
+        })
+        self.assertEqual(status.HTTP_201_CREATED, res.status_code)
+
+        # read-your-writes: the borrow pinned the user to default
+        with self.settled():
+            self.assertFalse(self.replica_reads(get_borrowing_list_url()))
+        cache.clear()
+        with self.settled():
+            self.assertTrue(self.replica_reads(get_borrowing_list_url()))
+
+    def test_list_reads_from_default_after_recent_change(self):
+        with self.settled():
+            self.assertTrue(self.replica_reads(get_borrowing_list_url()))
+
+        # an admin renames a book: the user isn't pinned, but the list's
+        # ETag names the change, which a replica may not show yet
+        admin = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.client.force_authenticate(admin)
+        self.client.patch(
+            reverse("books:book-detail", kwargs={"pk": self.book.id}),
+            {"title": "renamed"},
+        )
+        self.client.force_authenticate(self.user)
+        self.assertFalse(self.replica_reads(get_borrowing_list_url()))
+        with self.settled():
+            self.assertTrue(self.replica_reads(get_borrowing_list_url()))
+
+    def test_detail_reads_from_default(self):
+        borrowing = Borrowing.objects.create(
+            expected_return_date=timezone.now().date(),
+            book=self.book,
+            user=self.user,
+        )
+        url = reverse(
+            "borrowings:borrowing-detail", kwargs={"pk": borrowing.id}
+        )
+        self.assertFalse(self.replica_reads(url))
+        # the flag never outlives the request
+        self.assertFalse(replica_reads_enabled())
@@ -7,20 +7,71 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.db import transaction
 
+from books.cache import BOOK_EDITS, CATALOGUE
+from books.models import Book
+from borrowings import bulk
+from library.conditional import ConditionalGetMixin
+from library.metrics import SerializerMetricsMixin
+from library.streaming import (
+    EXPORT_CONTENT_TYPES,
+    keyset_chunks,
+    streaming_export,
+)
+from library.pagination import NewestFirstCursorPagination
+from library.routers import ReplicaReadMixin
+from library.rows import ValuesListMixin
+from borrowings.cache import (
+    ALL_BORROWINGS,
+    user_borrowings_version_name,
+)
 from borrowings.models import Borrowing
 from borrowings.serializers import (
     BorrowingSerializer,
     BorrowingListSerializer,
     BorrowingDetailSerializer,
     BorrowingCreateSerializer,
-    BorrowingReturnSerializer
+    BorrowingReturnSerializer,
+    BorrowingBulkCreateSerializer,
+    BorrowingBulkReturnSerializer,
 )
+from users.authentication import full_user
+from users.summary import forget_summaries
+
 
+EXPORT_FIELDS = {
+    "id": "id",
+    "borrow_date": "borrow_date",
+    "expected_return_date": "expected_return_date",
+    "actual_return_date": "actual_return_date",
+    "book": "book_id",
+    "book_title": "book__title",
+    "user": "user_id",
+    "user_email": "user__email",
+}
+EXPORT_CHUNK_SIZE = 2000
 
-class BorrowingViewSet(viewsets.ModelViewSet):
+
+class BorrowingViewSet(
+    SerializerMetricsMixin,
+    ReplicaReadMixin,
+    ConditionalGetMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Borrowing.objects.all()
     serializer_class = BorrowingSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = NewestFirstCursorPagination
+    vary_on_user = True
+    replica_actions = ("list",)
+
+    def get_version_names(self):
+        # lists embed book titles, details the whole book with inventory
+        books = CATALOGUE if self.action == "retrieve" else BOOK_EDITS
+        if self.request.user.is_staff:
+            return (ALL_BORROWINGS, books)
+        user_borrowings = user_borrowings_version_name(self.request.user.id)
+        return (user_borrowings, books)
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -31,6 +82,10 @@ class BorrowingViewSet(viewsets.ModelViewSet):
             return BorrowingCreateSerializer
         if self.action == "return_borrowing":
             return BorrowingReturnSerializer
+        if self.action == "bulk_borrow":
+            return BorrowingBulkCreateSerializer
+        if self.action == "bulk_return":
+            return BorrowingBulkReturnSerializer
         return self.serializer_class
 
     @staticmethod
@@ -41,7 +96,7 @@ class BorrowingViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = Borrowing.objects.select_related("book", "user")
         if not self.request.user.is_staff:
-            queryset = queryset.filter(user=self.request.user)
+            queryset = queryset.filter(user_id=self.request.user.id)
 
         is_active = self.request.query_params.get("is_active")
         if is_active:
@@ -55,6 +110,9 @@ class BorrowingViewSet(viewsets.ModelViewSet):
             user_id = self._params_to_ints(user_id)
             queryset = queryset.filter(user_id__in=user_id)
 
+        if self.action == "return_borrowing":
+            queryset = queryset.select_for_update(of=("self",))
+
         return queryset
 
     @extend_schema(
@@ -75,7 +133,13 @@ class BorrowingViewSet(viewsets.ModelViewSet):
         return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user=full_user(self.request.user))
+
+    def perform_update(self, serializer):
+        # a plain update may return or move a borrowing, recount both users
+        previous_user_id = serializer.instance.user_id
+        borrowing = serializer.save()
+        forget_summaries(previous_user_id, borrowing.user_id)
 
     @action(
         methods=["POST"],
@@ -91,11 +155,78 @@ class BorrowingViewSet(viewsets.ModelViewSet):
                 raise ValidationError(
                     "Borrowing was already returned"
                 )
-            book = borrowing.book
-            book.inventory += 1
-            book.save()
-
             serializer = self.get_serializer(borrowing, data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            Book.objects.increment_inventory(borrowing.book_id)
             return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    @action(methods=["POST"], detail=False, url_path="bulk-borrow")
+    def bulk_borrow(self, request):
+        """Borrow a stack of books, answers with a result per book"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk.borrow_books(
+            full_user(request.user), **serializer.validated_data
+        )
+        return Response(results, status=status.HTTP_200_OK)
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="bulk-return",
+        permission_classes=(IsAdminUser,),
+    )
+    def bulk_return(self, request):
+        """Return a stack of borrowings, answers with a result per id"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk.return_borrowings(**serializer.validated_data)
+        return Response(results, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "output",
+                type=OpenApiTypes.STR,
+                enum=sorted(EXPORT_CONTENT_TYPES),
+                description="Export format, csv (default) or ndjson",
+            ),
+            OpenApiParameter(
+                "is_active",
+                type=OpenApiTypes.BOOL,
+                description="Filter by active state (ex. ?is_active=True)",
+            ),
+            OpenApiParameter(
+                "user_id",
+                type={"type": "list", "items": {"type": "number"}},
+                description="Filter by user id (ex. ?user_id=2,5)",
+            ),
+        ],
+        responses={200: OpenApiTypes.BINARY},
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="export",
+        permission_classes=(IsAdminUser,),
+    )
+    def export(self, request):
+        """Stream the filtered borrowing history as CSV or NDJSON"""
+        output = request.query_params.get("output", "csv")
+        if output not in EXPORT_CONTENT_TYPES:
+            raise ValidationError(
+                {"output": f"Choose one of {', '.join(EXPORT_CONTENT_TYPES)}."}
+            )
+        rows = self.filter_queryset(self.get_queryset()).values_list(
+            *EXPORT_FIELDS.values()
+        )
+        return streaming_export(
+            request,
+            list(EXPORT_FIELDS),
+            keyset_chunks(rows, EXPORT_CHUNK_SIZE),
+            output,
+            "borrowings",
+        )
@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the ASGI deployment:
+gunicorn library.asgi:application -c gunicorn.conf.py
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(
+    os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1)
+)
+worker_class = "uvicorn.workers.UvicornWorker"
+# above PAYMENT_SESSION_MAX_WAIT, so long polls are never cut off
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
@@ -0,0 +1,61 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    NotAuthenticated,
+)
+from django.http import HttpResponse
+
+from library.renderers import ORJSONRenderer
+from users.authentication import PrincipalJWTAuthentication
+
+
+def api_response(data, status=200):
+    """JSON response rendered like a DRF Response"""
+    return HttpResponse(
+        ORJSONRenderer().render(data),
+        status=status,
+        content_type=ORJSONRenderer.media_type,
+    )
+
+
+def async_api_view(view):
+    """
+    Plain async Django view with DRF's error responses: APIExceptions
+    raised by the view are rendered as DRF's exception handler would.
+    DRF views are synchronous, so this is for the endpoints that wait on
+    something and must not hold a worker thread while doing so.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail
+            if not isinstance(data, (list, dict)):
+                data = {"detail": data}
+            response = api_response(data, exc.status_code)
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                response["WWW-Authenticate"] = (
+                    PrincipalJWTAuthentication().authenticate_header(request)
+                )
+            return response
+
+    return wrapper
+
+
+async def authenticate(request):
+    """
+    The user of the request's JWT, as the API authenticates it; raises
+    NotAuthenticated without a token and AuthenticationFailed for a bad one
+    """
+    result = await sync_to_async(
+        PrincipalJWTAuthentication().authenticate
+    )(request)
+    if result is None:
+        raise NotAuthenticated()
+    request.user, request.auth = result
+    return request.user
@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY_PREFIX = "version"
+MODIFIED_KEY_PREFIX = "modified"
+
+
+def get_version(name):
+    """
+    Current value of a named change counter. A missing counter starts
+    from the clock, so a counter lost to eviction never goes back to a
+    value that older cache entries were stored under.
+    """
+    key = f"{VERSION_KEY_PREFIX}:{name}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(f"{MODIFIED_KEY_PREFIX}:{name}", time.time(), timeout=None)
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_last_modified(*names):
+    """Unix time of the latest bump of any of the named counters"""
+    modified = cache.get_many(
+        [f"{MODIFIED_KEY_PREFIX}:{name}" for name in names]
+    )
+    return max(modified.values(), default=None)
+
+
+def bump_version(name):
+    cache.set(f"{MODIFIED_KEY_PREFIX}:{name}", time.time(), timeout=None)
+    try:
+        return cache.incr(f"{VERSION_KEY_PREFIX}:{name}")
+    except ValueError:
+        return get_version(name)
+
+
+def invalidate(*names):
+    """
+    Bump the counters now, so the current transaction never reads stale
+    entries, and again after commit, so entries cached by concurrent
+    requests from the pre-commit state are dropped as well.
+    """
+    for name in names:
+        bump_version(name)
+    transaction.on_commit(lambda: [bump_version(name) for name in names])
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from library.cache import get_last_modified, get_version
+from library.routers import settled_reads
+
+# "HTTP_AUTHORIZE" -> "Authorize"
+AUTH_HEADER = (
+    jwt_settings.AUTH_HEADER_NAME.removeprefix("HTTP_")
+    .replace("_", "-")
+    .title()
+)
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / Last-Modified to list and retrieve responses and answers
+    If-None-Match / If-Modified-Since with 304 before the queryset is
+    evaluated or serialized. Validators come from the change counters
+    named by `version_names` (or `get_version_names` when they depend on
+    the request), never from the rendered body. Views naming no counters
+    are served unconditionally.
+    """
+
+    version_names = ()
+    vary_on_user = False
+
+    def get_version_names(self):
+        return self.version_names
+
+    def get_validators(self, request):
+        names = self.get_version_names()
+        state = ";".join(f"{name}={get_version(name)}" for name in names)
+        digest = hashlib.md5(
+            f"{request.get_full_path()}|{state}".encode()
+        ).hexdigest()
+        last_modified = get_last_modified(*names)
+        return quote_etag(digest), last_modified and int(last_modified)
+
+    def _set_validators(self, response, etag, last_modified):
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        if self.vary_on_user:
+            response["Cache-Control"] = "private"
+            patch_vary_headers(response, (AUTH_HEADER,))
+        return response
+
+    def _conditional(self, view, request, *args, **kwargs):
+        if not self.get_version_names():
+            return view(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request)
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        has_etags = "HTTP_IF_NONE_MATCH" in request.META
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=None if has_etags else last_modified,
+        )
+        if response is None:
+            # the validators name the latest change, keep them off a
+            # body read from a replica that lacks it
+            with settled_reads(*self.get_version_names()):
+                response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return self._set_validators(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if "*" in parse_etags(if_none_match):
+            # "*" matches any current representation, if there is one
+            self.get_object()
+        return self._conditional(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,304 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_current_request = ContextVar("metrics_request", default=None)
+
+
+def _format_labels(labels):
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+         .replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return ",".join(f'{name}="{value}"' for name, value in escaped)
+
+
+class Histogram:
+    """Cumulative histogram with a series per label set"""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.setdefault(
+                labels, [[0] * len(self.buckets), 0.0, 0]
+            )
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        for labels, counts, total, count in sorted(series):
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _format_labels(labels + (("le", bound),))
+                yield f"{self.name}_bucket{{{bucket_labels}}} {bucket_count}"
+            inf_labels = _format_labels(labels + (("le", "+Inf"),))
+            yield f"{self.name}_bucket{{{inf_labels}}} {count}"
+            yield f"{self.name}_sum{{{_format_labels(labels)}}} {total}"
+            yield f"{self.name}_count{{{_format_labels(labels)}}} {count}"
+
+
+class CounterMetric:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{{{_format_labels(labels)}}} {value}"
+
+
+REQUEST_DURATION = Histogram(
+    "library_request_duration_seconds",
+    "Total time spent handling the request.",
+    LATENCY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    "library_db_duration_seconds",
+    "Time spent executing SQL per request.",
+    LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "library_db_queries",
+    "SQL statements executed per request.",
+    QUERY_COUNT_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    "library_serializer_duration_seconds",
+    "Time spent in serializer to_representation per request.",
+    LATENCY_BUCKETS,
+)
+QUERY_THRESHOLD_EXCEEDED = CounterMetric(
+    "library_query_threshold_exceeded_total",
+    "Requests that ran more SQL statements than METRICS_QUERY_THRESHOLD.",
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "library_password_hash_duration_seconds",
+    "Time to hash or check a password, waiting for a hashing slot included.",
+    LATENCY_BUCKETS,
+)
+PASSWORD_HASH_REJECTED = CounterMetric(
+    "library_password_hash_rejected_total",
+    "Password hashes refused with 429 because the hashing pool was full.",
+)
+REGISTRY = (
+    REQUEST_DURATION,
+    DB_DURATION,
+    DB_QUERIES,
+    SERIALIZER_DURATION,
+    QUERY_THRESHOLD_EXCEEDED,
+    PASSWORD_HASH_DURATION,
+    PASSWORD_HASH_REJECTED,
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+def view_labels(request):
+    """(view, action) for a resolved request, viewset actions by name"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return (("view", "unresolved"), ("action", request.method.lower()))
+    view_class = getattr(match.func, "cls", None)
+    actions = getattr(match.func, "actions", None) or {}
+    view = view_class.__name__ if view_class else match.view_name
+    action = actions.get(request.method.lower(), request.method.lower())
+    return (("view", view), ("action", action))
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request and counts the SQL it runs on every database
+    connection, then records both per view and action. Requests above
+    METRICS_QUERY_THRESHOLD statements are logged with the most repeated
+    statement, which is usually the N+1 culprit. Async-capable, so async
+    views keep running on the event loop under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.measure(request) as stats, self.wrap_connections(stats):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with self.measure(request) as stats:
+            # connections are per thread, wrap those of the thread that
+            # sync_to_async runs this request's sync code and queries in
+            stack = await sync_to_async(self.wrap_connections)(stats)
+            try:
+                return await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+
+    @contextmanager
+    def measure(self, request):
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            _current_request.reset(token)
+            # failing requests too, they're the ones worth timing
+            self.record(request, stats, time.perf_counter() - start)
+
+    @staticmethod
+    def wrap_connections(stats):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(stats.record_query)
+            )
+        return stack
+
+    @staticmethod
+    def record(request, stats, duration):
+        labels = view_labels(request)
+        REQUEST_DURATION.observe(labels, duration)
+        DB_DURATION.observe(labels, stats.db_time)
+        DB_QUERIES.observe(labels, stats.queries)
+        SERIALIZER_DURATION.observe(labels, stats.serializer_time)
+
+        if stats.queries > settings.METRICS_QUERY_THRESHOLD:
+            QUERY_THRESHOLD_EXCEEDED.inc(labels)
+            statement, repeats = stats.statements.most_common(1)[0]
+            logger.warning(
+                "%s %s ran %d queries; repeated %d times: %s",
+                request.method,
+                request.path,
+                stats.queries,
+                repeats,
+                statement,
+            )
+
+
+@contextmanager
+def serializer_timer():
+    """Adds the block's duration to the current request's serializer time"""
+    stats = _current_request.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - start
+
+
+class _TimedRepresentation:
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+_timed_serializers = {}
+
+
+def timed_serializer(serializer_class):
+    """Subclass of serializer_class whose to_representation is timed"""
+    if serializer_class not in _timed_serializers:
+        _timed_serializers[serializer_class] = type(
+            serializer_class.__name__,
+            (_TimedRepresentation, serializer_class),
+            {"__module__": serializer_class.__module__},
+        )
+    return _timed_serializers[serializer_class]
+
+
+# adds the view's serializer time to the request metrics; a comment
+# rather than a docstring, which drf-spectacular would publish as the
+# description of every endpoint
+class SerializerMetricsMixin:
+    def get_serializer_class(self):
+        serializer_class = super().get_serializer_class()
+        # keep component names untouched in the OpenAPI schema
+        if getattr(self, "swagger_fake_view", False):
+            return serializer_class
+        return timed_serializer(serializer_class)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of this process's metrics, for the
+    METRICS_TOKEN bearer, or for staff signed in to the admin site when
+    no token is set
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = request.headers.get("Authorization") == f"Bearer {token}"
+    else:
+        allowed = request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    lines = [line for metric in REGISTRY for line in metric.collect()]
+    return HttpResponse("\n".join(lines) + "\n", content_type=CONTENT_TYPE)
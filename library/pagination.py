@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: every page is an index range
+    scan from the cursor position and no COUNT(*) is issued.
+    """
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class NewestFirstCursorPagination(IdCursorPagination):
+    ordering = "-id"
+
+
+class RankedCursorPagination(IdCursorPagination):
+    """Orders search results (querysets annotated with `rank`) by relevance"""
+
+    def get_ordering(self, request, queryset, view):
+        if "rank" in queryset.query.annotations:
+            return ("-rank", "id")
+        return super().get_ordering(request, queryset, view)
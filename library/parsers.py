@@ -0,0 +1,30 @@
+import io
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from library.renderers import ORJSONRenderer
+
+UTF8_NAMES = ("utf-8", "utf8")
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser decoding UTF-8 bodies with orjson. Other charsets and
+    bodies orjson rejects are parsed by the stdlib parser, so invalid
+    JSON gets DRF's usual error message.
+    """
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        body = stream.read()
+        if encoding.lower() in UTF8_NAMES:
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,43 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+# DRF's JSONEncoder formats datetimes (milliseconds, "Z") and decimals
+# differently from orjson, so those are handed back to it
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes through orjson, except for
+    floats in exponent notation (orjson writes 1e-7, json 1e-07; the API
+    renders decimals as strings). Indented output (the browsable API,
+    `; indent=` in Accept) and anything orjson can't encode, such as
+    integers over 64 bits or non-string keys, go through the stdlib
+    renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=ORJSON_OPTIONS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # same escaping of the JavaScript line terminators as DRF
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
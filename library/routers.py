@@ -0,0 +1,141 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+from library.cache import get_last_modified
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+def _pin_key(user_id):
+    return f"routers:primary:{user_id}"
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Routes the block's reads to a replica, see ReplicaRouter"""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_enabled():
+    return _replica_reads.get()
+
+
+def replicas_may_lag(*names):
+    """
+    Whether one of the named change counters (library.cache) was bumped
+    within REPLICA_STICKY_SECONDS, so a replica may not show the change
+    yet. A counter that was just recreated counts as bumped.
+    """
+    if not settings.REPLICA_DATABASES:
+        return False
+    last_modified = get_last_modified(*names)
+    return (
+        last_modified is None
+        or time.time() - last_modified < settings.REPLICA_STICKY_SECONDS
+    )
+
+
+@contextmanager
+def settled_reads(*names):
+    """
+    Keeps the block's reads off the replicas while they may lag behind
+    the named counters. For responses stored under the counters' current
+    versions, which a stale replica body would otherwise be served as.
+    """
+    if replica_reads_enabled() and replicas_may_lag(*names):
+        with replica_reads(False):
+            yield
+    else:
+        yield
+
+
+def pin_to_primary(*user_ids):
+    """
+    Keep the users' reads on default for REPLICA_STICKY_SECONDS, so they
+    read their own writes while the replicas catch up. Pinned now and
+    again after commit, which restarts the window from the commit.
+    """
+    if not settings.REPLICA_DATABASES:
+        return
+    keys = dict.fromkeys(
+        (_pin_key(user_id) for user_id in user_ids if user_id is not None), 1
+    )
+
+    def pin():
+        cache.set_many(keys, settings.REPLICA_STICKY_SECONDS)
+
+    pin()
+    transaction.on_commit(pin)
+
+
+def is_pinned_to_primary(user_id):
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+class ReplicaRouter:
+    """
+    Sends reads made under replica_reads() to a random REPLICA_DATABASES
+    alias and everything else to default. Reads inside a transaction
+    stay on default, which may hold uncommitted rows they depend on.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if not replicas or not replica_reads_enabled():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # not the instance's database, which may be the replica it was
+        # read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+# reads of safe-method requests go to the replicas, for the actions in
+# replica_actions or every action when it's None, unless the user is
+# pinned to default; unsafe requests pin their user after the write
+class ReplicaReadMixin:
+    replica_actions = None
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            pin_to_primary(request.user.id)
+        elif self.reads_from_replica(request):
+            _replica_reads.set(True)
+
+    def reads_from_replica(self, request):
+        if (
+            self.replica_actions is not None
+            and self.action not in self.replica_actions
+        ):
+            return False
+        return not is_pinned_to_primary(request.user.id)
@@ -0,0 +1,270 @@
+import io
+import itertools
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from books.cache import CATALOGUE
+from books.models import Book
+from borrowings.cache import ALL_BORROWINGS
+from borrowings.models import Borrowing
+from library.cache import invalidate
+from payments.models import Payment
+from users.authentication import forget_cached_users
+
+WORDS = (
+    "shadow", "river", "empire", "garden", "winter", "silver", "storm",
+    "harbor", "kingdom", "forest", "night", "glass", "iron", "summer",
+    "dragon", "ocean", "letter", "mountain", "secret", "island", "crown",
+    "ember", "valley", "tower", "whisper", "autumn", "stone", "mirror",
+    "wolf", "lantern", "desert", "orchard", "thunder", "compass", "raven",
+    "meadow", "citadel", "harvest", "voyage", "frost", "cathedral", "map",
+    "orchid", "bridge", "comet", "legend", "salt", "garnet", "echo",
+    "willow", "canyon", "feather", "tide", "ashes", "clockwork", "song",
+)
+AUTHORS = (
+    "Tolkien", "Austen", "Orwell", "Le Guin", "Pratchett", "Atwood",
+    "Murakami", "Tolstoy", "Dickens", "Christie", "Borges", "Morrison",
+    "Woolf", "Calvino", "Achebe", "Ishiguro", "Adichie", "Eco",
+)
+SEED_PASSWORD = "library-seed"
+
+
+def _copy_value(value):
+    """One field in PostgreSQL COPY text format"""
+    if value is None:
+        return "\\N"
+    if value is True or value is False:
+        return "t" if value else "f"
+    return (
+        str(value).replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r")
+    )
+
+
+class LibrarySeeder:
+    """
+    Generates books, users, borrowings and payments with a fixed seed and
+    streams them into PostgreSQL with COPY FROM STDIN, `chunk_size` rows
+    at a time. Ids are assigned here, after the current maximum, so rows
+    can reference each other without reading anything back.
+
+    Borrowed books follow a Zipf-like popularity curve (`skew`, 0 is
+    uniform); `returned_ratio` of borrowings are returned, `overdue_ratio`
+    of the active ones are past their expected return date and
+    `payment_ratio` of borrowings get a payment, a fine when overdue.
+    """
+
+    def __init__(
+        self,
+        books,
+        users,
+        borrowings,
+        seed=0,
+        chunk_size=50_000,
+        skew=1.0,
+        returned_ratio=0.7,
+        overdue_ratio=0.2,
+        payment_ratio=0.3,
+        paid_ratio=0.8,
+        days=365,
+        log=None,
+    ):
+        if borrowings and not (books and users):
+            raise ValueError("Borrowings need at least one book and user")
+        self.books = books
+        self.users = users
+        self.borrowings = borrowings
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.skew = skew
+        self.returned_ratio = returned_ratio
+        self.overdue_ratio = overdue_ratio
+        self.payment_ratio = payment_ratio
+        self.paid_ratio = paid_ratio
+        self.days = days
+        self.log = log or (lambda message: None)
+        self.today = timezone.now().date()
+        self.counts = {}
+
+    def run(self):
+        user_model = get_user_model()
+        models = (user_model, Book, Borrowing, Payment)
+        tables = ", ".join(model._meta.db_table for model in models)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # ids are assigned here, keep other writers out meanwhile
+            cursor.execute(f"LOCK TABLE {tables} IN EXCLUSIVE MODE")
+            first_ids = {
+                model: self._next_id(cursor, model) for model in models
+            }
+            self.book_ids = self._id_range(first_ids[Book], self.books)
+            self.user_ids = self._id_range(first_ids[user_model], self.users)
+
+            self._copy(cursor, Book, self._book_rows())
+            self._copy(cursor, user_model, self._user_rows())
+            # COPY sends no signals; ids may have belonged to deleted users
+            for start in range(0, self.users, self.chunk_size):
+                forget_cached_users(
+                    *self.user_ids[start:start + self.chunk_size]
+                )
+            self._copy_borrowings(
+                cursor, first_ids[Borrowing], first_ids[Payment]
+            )
+            for model in models:
+                self._reset_sequence(cursor, model)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {tables}")
+        invalidate(CATALOGUE, ALL_BORROWINGS)
+        return self.counts
+
+    @staticmethod
+    def _id_range(first_id, count):
+        return range(first_id, first_id + count)
+
+    @staticmethod
+    def _next_id(cursor, model):
+        cursor.execute(
+            f"SELECT COALESCE(MAX(id), 0) + 1 FROM {model._meta.db_table}"
+        )
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def _reset_sequence(cursor, model):
+        table = model._meta.db_table
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {table}"
+        )
+
+    @staticmethod
+    def _columns(model):
+        names = {
+            Book: ("id", "title", "author", "cover", "inventory", "daily_fee"),
+            Borrowing: (
+                "id", "borrow_date", "expected_return_date",
+                "actual_return_date", "book", "user",
+            ),
+            Payment: (
+                "id", "status", "type", "borrowing", "session_url",
+                "session_id", "money_to_pay",
+            ),
+        }.get(model, (
+            "id", "password", "is_superuser", "first_name", "last_name",
+            "is_staff", "is_active", "date_joined", "email",
+        ))
+        return [model._meta.get_field(name).column for name in names]
+
+    def _copy_chunk(self, cursor, model, rows):
+        """COPY one chunk of rows, in _columns order, into the model"""
+        if not rows:
+            return
+        buffer = io.StringIO("".join(
+            "\t".join(map(_copy_value, row)) + "\n" for row in rows
+        ))
+        cursor.copy_expert(
+            f"COPY {model._meta.db_table} "
+            f"({', '.join(self._columns(model))}) FROM STDIN",
+            buffer,
+        )
+        label = model._meta.verbose_name_plural
+        self.counts[label] = self.counts.get(label, 0) + len(rows)
+        self.log(f"{label}: {self.counts[label]}")
+
+    def _copy(self, cursor, model, rows):
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, self.chunk_size)):
+            self._copy_chunk(cursor, model, chunk)
+
+    def _book_rows(self):
+        rng = self.rng
+        covers = Book.CoverChoices.values
+        for book_id in self.book_ids:
+            yield (
+                book_id,
+                " ".join(rng.sample(WORDS, 3)).title(),
+                rng.choice(AUTHORS),
+                rng.choice(covers),
+                rng.randint(0, 20),
+                Decimal(rng.randint(50, 500)) / 100,
+            )
+
+    def _user_rows(self):
+        # one hash for everyone, hashing millions would dominate the run
+        password = make_password(SEED_PASSWORD)
+        joined = timezone.now()
+        for user_id in self.user_ids:
+            yield (
+                user_id, password, False, "", "", False, True, joined,
+                f"reader{user_id}@seed.local",
+            )
+
+    def _popular_books(self, count):
+        """Book ids drawn with Zipf-like weights, the first ids most often"""
+        if not hasattr(self, "_cum_weights"):
+            self._cum_weights = list(itertools.accumulate(
+                1 / rank ** self.skew for rank in range(1, self.books + 1)
+            ))
+        return self.rng.choices(
+            self.book_ids, cum_weights=self._cum_weights, k=count
+        )
+
+    def _borrowing(self, borrowing_id, book_id):
+        rng = self.rng
+        today = self.today
+        if rng.random() < self.returned_ratio:
+            borrow_date = today - timedelta(days=rng.randint(1, self.days))
+            expected = borrow_date + timedelta(days=rng.randint(1, 30))
+            returned = borrow_date + timedelta(days=rng.randint(0, 40))
+            returned = min(returned, today)
+            late = returned > expected
+        elif rng.random() < self.overdue_ratio:
+            expected = today - timedelta(days=rng.randint(1, 60))
+            borrow_date = expected - timedelta(days=rng.randint(1, 30))
+            returned, late = None, True
+        else:
+            borrow_date = today - timedelta(days=rng.randint(0, 29))
+            expected = today + timedelta(days=rng.randint(0, 30))
+            returned, late = None, False
+        return (
+            borrowing_id, borrow_date, expected, returned, book_id,
+            rng.choice(self.user_ids),
+        ), late
+
+    def _payment(self, payment_id, borrowing_id, late):
+        rng = self.rng
+        return (
+            payment_id,
+            Payment.StatusChoices.PAID
+            if rng.random() < self.paid_ratio
+            else Payment.StatusChoices.PENDING,
+            Payment.TypeChoices.FINE if late else Payment.TypeChoices.PAYMENT,
+            borrowing_id,
+            f"https://checkout.stripe.com/c/pay/cs_seed_{payment_id}",
+            f"cs_seed_{payment_id}",
+            Decimal(rng.randint(100, 5000)) / 100,
+        )
+
+    def _copy_borrowings(self, cursor, first_borrowing_id, first_payment_id):
+        """Each chunk of borrowings is followed by its payments"""
+        borrowing_ids = itertools.count(first_borrowing_id)
+        payment_ids = itertools.count(first_payment_id)
+        remaining = self.borrowings
+        while remaining:
+            count = min(remaining, self.chunk_size)
+            remaining -= count
+            borrowings, payments = [], []
+            for book_id in self._popular_books(count):
+                row, late = self._borrowing(next(borrowing_ids), book_id)
+                borrowings.append(row)
+                if self.rng.random() < self.payment_ratio:
+                    payments.append(
+                        self._payment(next(payment_ids), row[0], late)
+                    )
+            self._copy_chunk(cursor, Borrowing, borrowings)
+            self._copy_chunk(cursor, Payment, payments)
@@ -12,10 +12,20 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,15 +49,18 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "books",
     "users",
     "borrowings",
     "payments",
+    "benchmarks",
     "drf_spectacular",
 ]
 
 MIDDLEWARE = [
+    "library.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -88,9 +101,39 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        # seconds a thread keeps its connection for its next request or
+        # task, 0 reconnects every time. Under ASGI every request runs in
+        # a new thread, so keep 0 there and pool with PgBouncer instead
+        "CONN_MAX_AGE": int(os.getenv("POSTGRES_CONN_MAX_AGE", 0)),
+        "CONN_HEALTH_CHECKS": env_flag("POSTGRES_CONN_HEALTH_CHECKS", True),
+        # required behind PgBouncer in transaction pooling mode
+        "DISABLE_SERVER_SIDE_CURSORS": env_flag(
+            "POSTGRES_DISABLE_SERVER_SIDE_CURSORS", False
+        ),
     }
 }
 
+# read replicas of default, "host:port,host:port"; book, borrowing list
+# and payment reads go there, see library.routers
+REPLICA_DATABASES = []
+for number, address in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1
+):
+    host, _, port = address.strip().partition(":")
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["library.routers.ReplicaRouter"]
+# seconds a user's reads stay on default after a write of theirs, longer
+# than the replicas usually lag
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -134,9 +177,20 @@ AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.PrincipalJWTAuthentication",
+    ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "library.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "library.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "library.pagination.IdCursorPagination",
+    "PAGE_SIZE": 50,
 }
 
 SPECTACULAR_SETTINGS = {
@@ -149,6 +203,33 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "AUTH_HEADER_NAME": "HTTP_AUTHORIZE",
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.TokenObtainPairSerializer",
+}
+# how long token auth reuses a user's auth hash and model instance,
+# seconds; saves through the ORM refresh both at once
+JWT_PRINCIPAL_CACHE_TIMEOUT = int(
+    os.getenv("JWT_PRINCIPAL_CACHE_TIMEOUT", 60)
+)
+# password hashing (registration, token issuance) runs in this many
+# processes per server process, 0 hashes in the request thread; beyond
+# the running hashes PASSWORD_HASHING_QUEUE may wait, the rest get a 429
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", 0))
+PASSWORD_HASHING_QUEUE = int(os.getenv("PASSWORD_HASHING_QUEUE", 8))
+PASSWORD_HASHING_RETRY_AFTER = int(
+    os.getenv("PASSWORD_HASHING_RETRY_AFTER", 1)
+)
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+        if REDIS_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    )
 }
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
@@ -157,6 +238,28 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_TIMEZONE = "UTC"
 CELERY_TASK_TIME_LIMIT = 60
+CELERY_BEAT_SCHEDULE = {
+    "scan-overdue-borrowings": {
+        "task": "payments.tasks.scan_overdue_borrowings_task",
+        "schedule": crontab(hour=0, minute=5),
+    },
+}
+
+# Notifications are coalesced per chat into one Telegram message per window
+# (seconds); 0 sends every notification immediately.
+TELEGRAM_NOTIFICATION_WINDOW = int(
+    os.getenv("TELEGRAM_NOTIFICATION_WINDOW", 5)
+)
 
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# per worker process; Stripe allows 25 req/s in test mode, 100 in live
+STRIPE_CHECKOUT_RATE_LIMIT = os.getenv("STRIPE_CHECKOUT_RATE_LIMIT", "20/s")
+# longest a client may block on the payment session endpoint, seconds
+PAYMENT_SESSION_MAX_WAIT = 20
+
+# requests running more SQL statements than this are logged
+METRICS_QUERY_THRESHOLD = int(os.getenv("METRICS_QUERY_THRESHOLD", 20))
+# bearer token required to scrape /metrics; staff sessions only when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryScalingMixin:
+    """
+    TestCase mixin guarding endpoints against N+1 queries: the same request
+    has to run the same number of SQL statements with `scaling_base` and
+    with `scaling_factor` times as many seeded rows.
+    """
+
+    scaling_base = 5
+    scaling_factor = 10
+
+    def assertQueriesConstant(self, seed, request):
+        """
+        `seed(count)` adds `count` more rows, `request()` performs the call
+        under test and returns its response. Caches are cleared before each
+        measurement so both calls reach the database.
+        """
+        sizes = (self.scaling_base, self.scaling_base * self.scaling_factor)
+        captured = []
+        seeded = 0
+        for size in sizes:
+            seed(size - seeded)
+            seeded = size
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            self.assertLess(
+                response.status_code, 400, getattr(response, "data", None)
+            )
+            captured.append(context.captured_queries)
+
+        small, large = captured
+        self.assertEqual(
+            len(small),
+            len(large),
+            "Query count grows with the number of rows "
+            f"({sizes[0]} rows: {len(small)}, {sizes[1]} rows: "
+            f"{len(large)}):\n"
+            + "\n".join(query["sql"] for query in large),
+        )
+        return len(large)
@@ -0,0 +1,479 @@
+import io
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest.mock import Mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.db import router
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.utils import timezone
+from django.utils.http import http_date
+from django.urls import reverse
+from rest_framework import status, viewsets
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from books.cache import CATALOGUE
+from books.models import Book
+from books.serializers import BookSerializer
+from borrowings.models import Borrowing
+from borrowings.serializers import (
+    BorrowingDetailSerializer,
+    BorrowingListSerializer,
+)
+from payments.models import Payment
+from payments.serializers import PaymentListSerializer
+from books.tests import book_list_url, sample_book
+from library import metrics
+from library.metrics import Histogram, RequestMetricsMiddleware
+from library.parsers import ORJSONParser
+from library.renderers import ORJSONRenderer
+from library.cache import bump_version
+from library.conditional import ConditionalGetMixin
+from library.routers import replica_reads, settled_reads
+from library.rows import RowFormatter
+from library.seeding import LibrarySeeder
+from library.testing import QueryScalingMixin
+
+
+def metric_line(body, name, view, action):
+    prefix = f'{name}{{view="{view}",action="{action}"}} '
+    for line in body.splitlines():
+        if line.startswith(prefix):
+            return float(line.removeprefix(prefix))
+    return None
+
+
+class HistogramTests(TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram("test_seconds", "Test.", (1, 5))
+        labels = (("view", "v"), ("action", "a"))
+        for value in (0.5, 3, 7):
+            histogram.observe(labels, value)
+
+        lines = list(histogram.collect())
+
+        for bound, count in (("1", 1), ("5", 2), ("+Inf", 3)):
+            self.assertIn(
+                f'test_seconds_bucket{{view="v",action="a",le="{bound}"}} '
+                f"{count}",
+                lines,
+            )
+        self.assertIn('test_seconds_sum{view="v",action="a"} 10.5', lines)
+
+    def test_label_values_escaped(self):
+        histogram = Histogram("test_seconds", "Test.", (1,))
+        histogram.observe((("view", 'a"b\\c'),), 1)
+        self.assertIn(
+            'test_seconds_count{view="a\\"b\\\\c"} 1',
+            list(histogram.collect()),
+        )
+
+
+@override_settings(METRICS_TOKEN="secret")
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        Book.objects.bulk_create(
+            Book(**{**sample_book(), "title": f"book {i}"}) for i in range(3)
+        )
+
+    def scrape(self):
+        res = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        return res.content.decode()
+
+    def test_viewset_action_recorded(self):
+        before = metric_line(
+            self.scrape(), "library_db_queries_count", "BookViewSet", "list"
+        ) or 0
+
+        self.client.get(book_list_url())
+        body = self.scrape()
+
+        self.assertEqual(
+            before + 1,
+            metric_line(
+                body, "library_db_queries_count", "BookViewSet", "list"
+            ),
+        )
+        self.assertGreater(
+            metric_line(
+                body, "library_serializer_duration_seconds_sum",
+                "BookViewSet", "list",
+            ),
+            0,
+        )
+        self.assertIn(
+            "# TYPE library_request_duration_seconds histogram", body
+        )
+
+    async def test_async_view_recorded(self):
+        url = reverse(
+            "payments:payment_success", kwargs={"session_id": "unknown"}
+        )
+        res = await self.async_client.get(url)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, res.status_code)
+
+        res = await self.async_client.get(
+            reverse("metrics"), headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(
+            1,
+            metric_line(
+                res.content.decode(),
+                "library_db_queries_sum",
+                "payments:payment_success",
+                "get",
+            ),
+        )
+
+    @override_settings(METRICS_QUERY_THRESHOLD=0)
+    def test_query_threshold_logged(self):
+        with self.assertLogs(metrics.logger, "WARNING") as logs:
+            self.client.get(book_list_url())
+        self.assertIn("GET /api/library/books/ ran", logs.output[0])
+        self.assertIsNotNone(
+            metric_line(
+                self.scrape(),
+                "library_query_threshold_exceeded_total",
+                "BookViewSet",
+                "list",
+            )
+        )
+
+    def test_failing_request_recorded(self):
+        def count():
+            return metric_line(
+                self.scrape(), "library_request_duration_seconds_count",
+                "unresolved", "get",
+            ) or 0
+
+        before = count()
+        middleware = RequestMetricsMiddleware(
+            Mock(side_effect=RuntimeError("view failed"))
+        )
+        with self.assertRaises(RuntimeError):
+            middleware(RequestFactory().get(book_list_url()))
+        self.assertEqual(before + 1, count())
+
+    def test_scrape_requires_token_when_configured(self):
+        res = self.client.get(reverse("metrics"))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, res.status_code)
+
+        res = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_scrape_staff_only_without_token(self):
+        res = self.client.get(reverse("metrics"))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, res.status_code)
+
+        self.client.force_login(self.user)
+        res = self.client.get(reverse("metrics"))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, res.status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        res = self.client.get(reverse("metrics"))
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+
+class QueryScalingMixinTests(QueryScalingMixin, TestCase):
+    def seed_books(self, count):
+        Book.objects.bulk_create(Book(**sample_book()) for _ in range(count))
+
+    def test_constant_queries_pass(self):
+        def request():
+            list(Book.objects.all())
+            return HttpResponse()
+
+        queries = self.assertQueriesConstant(self.seed_books, request)
+        self.assertEqual(1, queries)
+
+    def test_n_plus_one_detected(self):
+        def request():
+            for book in Book.objects.all():
+                book.borrowings.exists()
+            return HttpResponse()
+
+        with self.assertRaisesMessage(AssertionError, "5 rows: 6"):
+            self.assertQueriesConstant(self.seed_books, request)
+
+
+class LibrarySeederTests(TestCase):
+    def seed(self, **kwargs):
+        options = {"books": 50, "users": 10, "borrowings": 400, "seed": 3}
+        return LibrarySeeder(**{**options, **kwargs}, chunk_size=64).run()
+
+    def test_counts_and_sequences(self):
+        counts = self.seed(payment_ratio=0.5)
+
+        self.assertEqual(50, Book.objects.count())
+        self.assertEqual(10, get_user_model().objects.count())
+        self.assertEqual(400, Borrowing.objects.count())
+        self.assertEqual(counts["payments"], Payment.objects.count())
+        self.assertGreater(counts["payments"], 0)
+        # sequences continue after the copied ids
+        book = Book.objects.create(**sample_book())
+        self.assertEqual(Book.objects.order_by("-id")[1].id + 1, book.id)
+
+    def test_same_seed_same_data(self):
+        self.seed()
+        first = list(
+            Borrowing.objects.order_by("id")
+            .values_list("book__title", "expected_return_date")
+        )
+        Book.objects.all().delete()
+        get_user_model().objects.all().delete()
+
+        self.seed()
+        second = list(
+            Borrowing.objects.order_by("id")
+            .values_list("book__title", "expected_return_date")
+        )
+        self.assertEqual(first, second)
+
+    def test_popularity_skew(self):
+        self.seed(skew=1.5)
+        first_book = Book.objects.order_by("id").first()
+        self.assertGreater(
+            Borrowing.objects.filter(book=first_book).count(), 400 / 50 * 5
+        )
+
+    def test_overdue_ratio(self):
+        self.seed(returned_ratio=0, overdue_ratio=1)
+        today = timezone.now().date()
+        self.assertFalse(
+            Borrowing.objects.filter(expected_return_date__gte=today).exists()
+        )
+        self.assertTrue(
+            Payment.objects.filter(type=Payment.TypeChoices.FINE).exists()
+        )
+
+    def test_command_rejects_bad_sizes(self):
+        for args in (
+            ("--chunk-size", "0"),
+            ("--chunk-size", "-5"),
+            ("--books", "-1"),
+            ("--borrowings", "-1"),
+        ):
+            with self.assertRaises(CommandError):
+                call_command("seed_library", *args)
+        self.assertFalse(Book.objects.exists())
+
+
+class RowFormatterTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        book = Book.objects.create(
+            title="Ünïcode \"quoted\"", author="Author", cover="Soft",
+            inventory=0, daily_fee=Decimal("1.5"),
+        )
+        returned = Borrowing.objects.create(
+            borrow_date=date(2024, 1, 1),
+            expected_return_date=date(2024, 1, 5),
+            actual_return_date=date(2024, 1, 3),
+            book=book,
+            user=user,
+        )
+        Borrowing.objects.create(
+            borrow_date=date(2024, 2, 1),
+            expected_return_date=date(2024, 2, 5),
+            book=book,
+            user=user,
+        )
+        Payment.objects.create(
+            status=Payment.StatusChoices.PAID,
+            type=Payment.TypeChoices.FINE,
+            borrowing=returned,
+            session_url="https://checkout.stripe.com/c/pay/cs_1",
+            session_id="cs_1",
+            money_to_pay=Decimal("12"),
+        )
+
+    def assertSameBody(self, queryset, serializer_class):
+        formatter = RowFormatter(serializer_class)
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(serializer_class(queryset, many=True).data),
+            renderer.render(formatter.format(formatter.values(queryset))),
+        )
+
+    def test_matches_serializers_byte_for_byte(self):
+        self.assertSameBody(Book.objects.order_by("id"), BookSerializer)
+        self.assertSameBody(
+            Borrowing.objects.select_related("book").order_by("id"),
+            BorrowingListSerializer,
+        )
+        self.assertSameBody(
+            Payment.objects.order_by("id"), PaymentListSerializer
+        )
+
+    def test_lookups(self):
+        formatter = RowFormatter(BorrowingListSerializer)
+        self.assertEqual(
+            ("id", "borrow_date", "expected_return_date",
+             "actual_return_date", "book__title", "user_id"),
+            formatter.lookups,
+        )
+
+    def test_annotations_kept_for_pagination(self):
+        formatter = RowFormatter(BookSerializer)
+        row = formatter.values(Book.objects.search("author")).get()
+        self.assertIn("rank", row)
+        self.assertNotIn("rank", formatter.format([row])[0])
+
+    def test_nested_serializer_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RowFormatter(BorrowingDetailSerializer)
+
+
+class ORJSONRendererTests(TestCase):
+    data = {
+        "decimal": Decimal("1.50"),
+        "date": date(2024, 1, 2),
+        "datetime": datetime(
+            2024, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc
+        ),
+        "text": "Ünïcode \"quoted\" \u2028 line",
+        "results": [{"id": 1, "none": None, "flag": True, "fee": 0.5}],
+    }
+
+    def assertSameBytes(self, data, accepted_media_type=None, context=None):
+        self.assertEqual(
+            JSONRenderer().render(data, accepted_media_type, context),
+            ORJSONRenderer().render(data, accepted_media_type, context),
+        )
+
+    def test_same_bytes_as_json_renderer(self):
+        self.assertSameBytes(self.data)
+        self.assertEqual(b"", ORJSONRenderer().render(None))
+
+    def test_indent_and_unsupported_values_fall_back(self):
+        self.assertSameBytes(self.data, "application/json; indent=4")
+        self.assertSameBytes(self.data, context={"indent": 2})
+        self.assertSameBytes({"big": 2 ** 70, 1: "int key"})
+
+
+class ORJSONParserTests(TestCase):
+    def parse(self, body, encoding="utf-8"):
+        return ORJSONParser().parse(
+            io.BytesIO(body), parser_context={"encoding": encoding}
+        )
+
+    def test_parses_like_json_parser(self):
+        body = '{"title": "Ünïcode", "ids": [1, 2]}'.encode()
+        self.assertEqual(
+            JSONParser().parse(io.BytesIO(body)), self.parse(body)
+        )
+        self.assertEqual(
+            {"big": 2 ** 70}, self.parse(b'{"big": %d}' % 2 ** 70)
+        )
+        self.assertEqual(
+            {"title": "é"}, self.parse('{"title": "é"}'.encode("latin-1"),
+                                       encoding="latin-1")
+        )
+
+    def test_invalid_json_error(self):
+        with self.assertRaisesMessage(ParseError, "JSON parse error - "):
+            self.parse(b'{"title": ')
+        with self.assertRaises(ParseError):
+            self.parse(b'{"fee": NaN}')
+
+
+@override_settings(REPLICA_DATABASES=["replica"])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_routed_under_replica_reads(self):
+        self.assertEqual("default", Book.objects.all().db)
+        with replica_reads():
+            self.assertEqual("replica", Book.objects.all().db)
+            with replica_reads(False):
+                self.assertEqual("default", Book.objects.all().db)
+        self.assertEqual("default", Book.objects.all().db)
+
+    def test_writes_and_migrations_stay_on_default(self):
+        book = Book()
+        book._state.db = "replica"
+        with replica_reads():
+            self.assertEqual(
+                "default", router.db_for_write(Book, instance=book)
+            )
+        self.assertFalse(router.allow_migrate("replica", "books"))
+        self.assertTrue(router.allow_migrate("default", "books"))
+
+    def test_recent_changes_read_from_default(self):
+        bump_version("tests:counter")
+        with replica_reads(), settled_reads("tests:counter"):
+            self.assertEqual("default", Book.objects.all().db)
+        with (
+            override_settings(REPLICA_STICKY_SECONDS=0),
+            replica_reads(),
+            settled_reads("tests:counter"),
+        ):
+            self.assertEqual("replica", Book.objects.all().db)
+
+
+class UnversionedBookViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Book.objects.all()
+    serializer_class = BookSerializer
+    permission_classes = ()
+
+
+class CatalogueBookViewSet(UnversionedBookViewSet):
+    version_names = (CATALOGUE,)
+
+
+class ConditionalGetMixinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def get(self, viewset, **headers):
+        view = viewset.as_view({"get": "list"})
+        return view(self.factory.get("/books/", **headers))
+
+    def test_no_version_names_served_unconditionally(self):
+        res = self.get(UnversionedBookViewSet, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertNotIn("ETag", res)
+        self.assertNotIn("Last-Modified", res)
+
+    def test_version_names_attribute_sets_validators(self):
+        res = self.get(CatalogueBookViewSet)
+        self.assertIn("ETag", res)
+        res = self.get(CatalogueBookViewSet, HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, res.status_code)
+
+    def test_if_none_match_overrides_if_modified_since(self):
+        bump_version(CATALOGUE)
+        res = self.get(
+            CatalogueBookViewSet,
+            HTTP_IF_NONE_MATCH='"stale"',
+            HTTP_IF_MODIFIED_SINCE=http_date(),
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertIn("ETag", res)
@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from library.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/library/", include("books.urls", namespace="books")),
@@ -26,4 +28,5 @@ urlpatterns = [
     path("api/users/", include("users.urls", namespace="users")),
     path("api/doc/", SpectacularAPIView.as_view(), name="doc"),
     path("api/doc/swagger", SpectacularSwaggerView.as_view(url_name="doc"), name="swagger"),
+    path("metrics", metrics_view, name="metrics"),
 ]
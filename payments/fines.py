@@ -0,0 +1,150 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from borrowings.models import Borrowing
+from payments.models import OverdueScan, Payment
+from payments.stripe_utils import FINE_MULTIPLIER
+from users.summary import change_summaries
+
+DIGEST_MAX_LINES = 50
+
+
+def fine_amount(expected_return_date, until, daily_fee):
+    """The fine for every day from expected_return_date to until"""
+    return (until - expected_return_date).days * daily_fee * FINE_MULTIPLIER
+
+
+def _issue_fines(amounts, borrowers, overdue):
+    """
+    Creates a pending FINE of each {borrowing_id: amount} and adds it to
+    the borrowers' ({borrowing_id: user_id}) outstanding totals, and to
+    their overdue borrowings when `overdue` (the borrowing's first fine)
+    """
+    fines = Payment.objects.bulk_create(
+        Payment(
+            status=Payment.StatusChoices.PENDING,
+            type=Payment.TypeChoices.FINE,
+            borrowing_id=borrowing_id,
+            money_to_pay=amount,
+        )
+        for borrowing_id, amount in amounts.items()
+    )
+    changes = {}
+    for fine in fines:
+        deltas = changes.setdefault(
+            borrowers[fine.borrowing_id],
+            {"overdue_borrowings": 0, "outstanding": 0},
+        )
+        deltas["overdue_borrowings"] += overdue
+        deltas["outstanding"] += fine.money_to_pay
+    change_summaries(changes)
+    return fines
+
+
+def create_overdue_fines(today=None):
+    """
+    Creates a FINE payment for every active overdue borrowing that has
+    none yet, for the days overdue so far; settle_overdue_fines()
+    completes it when the book comes back. Fined borrowings are
+    excluded, so a second run fines nothing twice, and borrowings
+    backdated past an earlier run are still found.
+    """
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        # serialises concurrent sweeps on the checkpoint row
+        scan, _ = OverdueScan.objects.select_for_update().get_or_create(pk=1)
+        overdue = Borrowing.objects.filter(
+            actual_return_date__isnull=True,
+            expected_return_date__lt=today,
+        ).exclude(payment__type=Payment.TypeChoices.FINE)
+        amounts, borrowers = {}, {}
+        for borrowing in overdue.values(
+            "id", "expected_return_date", "book__daily_fee", "user_id"
+        ):
+            borrowers[borrowing["id"]] = borrowing["user_id"]
+            amounts[borrowing["id"]] = fine_amount(
+                borrowing["expected_return_date"],
+                today,
+                borrowing["book__daily_fee"],
+            )
+        fines = _issue_fines(amounts, borrowers, overdue=True)
+        scan.scanned_until = today
+        scan.save()
+    return fines
+
+
+def settle_overdue_fines(borrowing_ids):
+    """
+    Completes the fines of borrowings just returned late, in the
+    caller's transaction. The sweep fines the days overdue when it finds
+    a borrowing, so a return adds a FINE for the days since, up to the
+    actual return date; a late return the sweep never saw is fined in
+    full. The new fines get their checkout sessions after commit.
+    """
+    # the task module imports this one
+    from payments.tasks import create_checkout_session_task
+
+    late = (
+        Borrowing.objects.filter(
+            pk__in=borrowing_ids,
+            actual_return_date__gt=F("expected_return_date"),
+        )
+        .annotate(fined=Coalesce(
+            Sum(
+                "payment__money_to_pay",
+                filter=Q(payment__type=Payment.TypeChoices.FINE),
+            ),
+            Value(Decimal(0)),
+        ))
+        .values(
+            "id", "expected_return_date", "actual_return_date",
+            "book__daily_fee", "user_id", "fined",
+        )
+    )
+    amounts, borrowers = {}, {}
+    for borrowing in late:
+        amount = fine_amount(
+            borrowing["expected_return_date"],
+            borrowing["actual_return_date"],
+            borrowing["book__daily_fee"],
+        ) - borrowing["fined"]
+        if amount > 0:
+            borrowers[borrowing["id"]] = borrowing["user_id"]
+            amounts[borrowing["id"]] = amount
+    fines = _issue_fines(amounts, borrowers, overdue=False)
+
+    def create_sessions():
+        for fine in fines:
+            create_checkout_session_task.delay(fine.id)
+
+    transaction.on_commit(create_sessions)
+    return fines
+
+
+def overdue_digest(fines):
+    """One notification listing the new fines"""
+    shown_ids = [fine.id for fine in fines[:DIGEST_MAX_LINES]]
+    shown = (
+        Payment.objects.filter(id__in=shown_ids)
+        .order_by("id")
+        .values_list(
+            "borrowing_id",
+            "borrowing__book__title",
+            "borrowing__user__email",
+            "borrowing__expected_return_date",
+            "money_to_pay",
+        )
+    )
+    lines = [f":: Overdue borrowings: {len(fines)} new ::"]
+    lines += [
+        f"borrowing {borrowing_id}: {title} by {email}, "
+        f"due {due_date}, fine {money_to_pay}"
+        for borrowing_id, title, email, due_date, money_to_pay in shown
+    ]
+    if len(fines) > DIGEST_MAX_LINES:
+        lines.append(f"... and {len(fines) - DIGEST_MAX_LINES} more")
+    return "\n".join(lines)
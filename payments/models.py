@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 
 from borrowings.models import Borrowing
 
@@ -15,13 +16,35 @@ class Payment(models.Model):
     status = models.CharField(max_length=10, choices=StatusChoices.choices)
     type = models.CharField(max_length=10, choices=TypeChoices.choices)
     borrowing = models.ForeignKey(Borrowing, on_delete=models.CASCADE)
-    session_url = models.URLField()
+    session_url = models.URLField(blank=True)
     session_id = models.CharField(max_length=255, blank=True)
     money_to_pay = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session_id"],
+                condition=~Q(session_id=""),
+                name="payment_session_id_unique",
+            ),
+        ]
+
     def __str__(self):
         return (
             f"id: {self.session_id}"
             f"Type: {self.type};"
             f"Status: {self.status};"
         )
+
+
+class OverdueScan(models.Model):
+    """
+    Last run of the overdue sweep; concurrent sweeps serialise on this
+    row's lock.
+    """
+
+    scanned_until = models.DateField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Overdue scan until {self.scanned_until}"
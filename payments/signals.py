@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+
+from borrowings.models import Borrowing
 from payments.models import Payment
-from borrowings.telegram_actions import send_notification
+from payments.tasks import send_notification_task
+from users.summary import forget_summaries, writes_tracked
 
 
 @receiver(post_save, sender=Payment)
@@ -13,4 +18,24 @@ def notify_payment_creation(sender, instance, created, **kwargs):
                    f"status: {instance.status}\n"
                    f"URL: {instance.session_url}\n"
                    f"money to pay: {instance.money_to_pay}")
-        send_notification(message)
+        transaction.on_commit(lambda: send_notification_task.delay(message))
+
+
+@receiver(post_delete, sender=Payment)
+def forget_payer_summary(sender, instance, **kwargs):
+    forget_summaries(*Borrowing.objects.filter(
+        pk=instance.borrowing_id
+    ).values_list("user_id", flat=True))
+
+
+@receiver(pre_save, sender=Payment)
+def forget_untracked_payer_summary(sender, instance, **kwargs):
+    if writes_tracked():
+        return
+    borrowings = Q(pk=instance.borrowing_id)
+    if instance.pk:
+        # the previous payer, if the payment is moved
+        borrowings |= Q(payment__pk=instance.pk)
+    forget_summaries(*Borrowing.objects.filter(borrowings).values_list(
+        "user_id", flat=True
+    ))
@@ -1,7 +1,9 @@
 import stripe
+from django.db import transaction
 
 from library import settings
 from payments.models import Payment
+from users.summary import change_summary, tracked_writes
 
 from datetime import datetime
 
@@ -11,13 +13,15 @@ FINE_MULTIPLIER = 2
 
 def calculate_total_price(borrowing):
     return_date = (
-        borrowing.actual_return if borrowing.actual_return else datetime.now().date()
+        borrowing.actual_return_date
+        if borrowing.actual_return_date
+        else datetime.now().date()
     )
     num_days = (return_date - borrowing.borrow_date).days
     total_price = num_days * borrowing.book.daily_fee
 
-    if borrowing.expected_return < return_date:
-        overdue_days = (return_date - borrowing.expected_return).days
+    if borrowing.expected_return_date < return_date:
+        overdue_days = (return_date - borrowing.expected_return_date).days
         total_price += overdue_days * borrowing.book.daily_fee * FINE_MULTIPLIER
 
     return total_price
@@ -27,8 +31,33 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
 def create_stripe_session(borrowing):
-    total_price = calculate_total_price(borrowing)
+    """
+    Records a pending payment right away and leaves the Stripe checkout
+    session to a worker, so the caller never waits on Stripe.
+    """
+    # the task module imports this one
+    from payments.tasks import create_checkout_session_task
 
+    with tracked_writes():
+        payment = Payment.objects.create(
+            status=Payment.StatusChoices.PENDING,
+            type=Payment.TypeChoices.PAYMENT,
+            borrowing=borrowing,
+            money_to_pay=calculate_total_price(borrowing),
+        )
+    change_summary(borrowing.user_id, outstanding=payment.money_to_pay)
+    transaction.on_commit(
+        lambda: create_checkout_session_task.delay(payment.id)
+    )
+    return payment
+
+
+def create_checkout_session(payment):
+    """
+    Creates the Stripe checkout session for a payment and stores it.
+    The idempotency key makes retries return the session Stripe already
+    created instead of opening a second one.
+    """
     session = stripe.checkout.Session.create(
         payment_method_types=["card"],
         line_items=[
@@ -36,9 +65,9 @@ def create_stripe_session(borrowing):
                 "price_data": {
                     "currency": "usd",
                     "product_data": {
-                        "name": borrowing.book.title,
+                        "name": payment.borrowing.book.title,
                     },
-                    "unit_amount": int(total_price * 100),
+                    "unit_amount": int(payment.money_to_pay * 100),
                 },
                 "quantity": 1,
             }
@@ -46,15 +75,10 @@ def create_stripe_session(borrowing):
         mode="payment",
         success_url="http://localhost:8000/api/payments/payment-success/{CHECKOUT_SESSION_ID}/",
         cancel_url="http://localhost:8000/api/payments/payment-cancelled/",
+        idempotency_key=f"checkout-session-payment-{payment.id}",
     )
-
-    payment = Payment.objects.create(
-        status=Payment.StatusChoices.PENDING,
-        type=Payment.TypeChoices.PAYMENT,
-        borrowing=borrowing,
-        session_url=f"https://checkout.stripe.com/pay/{session.id}",
+    Payment.objects.filter(pk=payment.pk, session_id="").update(
         session_id=session.id,
-        money_to_pay=total_price,
+        session_url=session.url,
     )
-
-    return payment
+    return session
@@ -1,8 +1,49 @@
+import stripe
 from celery import shared_task
+from django.conf import settings
 
-from borrowings.telegram_actions import send_notification
+from borrowings.tasks import (
+    send_notification_task as send_borrowing_notification_task
+)
+from payments.fines import create_overdue_fines, overdue_digest
+from payments.models import Payment
+from payments.stripe_utils import create_checkout_session
+
+RETRYABLE_STRIPE_ERRORS = (
+    stripe.error.RateLimitError,
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+)
 
 
 @shared_task
 def send_notification_task(message: str):
-    send_notification(message)
+    send_borrowing_notification_task(message)
+
+
+@shared_task(
+    rate_limit=settings.STRIPE_CHECKOUT_RATE_LIMIT,
+    autoretry_for=RETRYABLE_STRIPE_ERRORS,
+    retry_backoff=True,
+    retry_backoff_max=60,
+    max_retries=6,
+)
+def create_checkout_session_task(payment_id: int):
+    payment = (
+        Payment.objects.select_related("borrowing__book")
+        .filter(pk=payment_id, session_id="")
+        .first()
+    )
+    if payment is None:
+        return None
+    return create_checkout_session(payment).id
+
+
+@shared_task
+def scan_overdue_borrowings_task():
+    fines = create_overdue_fines()
+    for fine in fines:
+        create_checkout_session_task.delay(fine.id)
+    if fines:
+        send_notification_task.delay(overdue_digest(fines))
+    return len(fines)
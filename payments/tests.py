@@ -1,18 +1,108 @@
-from unittest.mock import patch, MagicMock
+import hashlib
+import hmac
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+
+import stripe
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection, IntegrityError
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 from books.models import Book
 from borrowings.models import Borrowing
-from payments.models import Payment
+from payments.fines import create_overdue_fines
+from payments.models import OverdueScan, Payment
 from payments.serializers import PaymentListSerializer, PaymentDetailSerializer
-from payments.views import payment_success, payment_cancelled
+from payments.stripe_utils import calculate_total_price, create_stripe_session
+from payments.tasks import (
+    create_checkout_session_task,
+    scan_overdue_borrowings_task,
+)
+from payments.views import payment_cancelled
+from library.testing import QueryScalingMixin
+from users.authentication import AccessToken
 
 PAYMENTS_URLS = reverse("payments:payment-list")
+WEBHOOK_URL = reverse("payments:stripe_webhook")
+WEBHOOK_SECRET = "whsec_test"
+
+
+def payment_session_url(payment_id):
+    return reverse("payments:payment-session", kwargs={"pk": payment_id})
+
+
+def jwt_credentials(user):
+    """Header for the async views, which force_authenticate doesn't reach"""
+    return {"HTTP_AUTHORIZE": f"Bearer {AccessToken.for_user(user)}"}
+
+
+class StripeSessionStub:
+    """Local stand-in for stripe.checkout.Session.create"""
+
+    def __init__(self, failures=()):
+        self.calls = []
+        self.failures = list(failures)
+
+    def __call__(self, **params):
+        self.calls.append(params)
+        if self.failures:
+            raise self.failures.pop(0)
+        session_id = f"cs_test_{params['idempotency_key']}"
+        return SimpleNamespace(
+            id=session_id,
+            url=f"https://checkout.stripe.com/c/pay/{session_id}",
+        )
+
 
+def payment_success_url(session_id):
+    return reverse(
+        "payments:payment_success", kwargs={"session_id": session_id}
+    )
 
+
+def stripe_event(session_id, payment_status="paid",
+                 event_type="checkout.session.completed"):
+    return json.dumps({
+        "id": "evt_test",
+        "object": "event",
+        "type": event_type,
+        "data": {
+            "object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "payment_status": payment_status,
+            }
+        },
+    })
+
+
+def sign_stripe_payload(payload, secret=WEBHOOK_SECRET):
+    """Builds a Stripe-Signature header the way Stripe signs webhooks"""
+    timestamp = int(time.time())
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def post_stripe_event(client, payload, signature=None):
+    return client.post(
+        WEBHOOK_URL,
+        data=payload,
+        content_type="application/json",
+        HTTP_STRIPE_SIGNATURE=signature or sign_stripe_payload(payload),
+    )
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
 class PaymentsTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -45,7 +135,7 @@ class PaymentsTests(TestCase):
         res = self.client.get(PAYMENTS_URLS)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         serializer = PaymentListSerializer(Payment.objects.all(), many=True)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_payment_detail(self):
         self.client.force_authenticate(user=self.user)
@@ -57,32 +147,535 @@ class PaymentsTests(TestCase):
 
     @patch("stripe.checkout.Session.retrieve")
     def test_payment_successful(self, mock_retrieve):
-        mock_session = MagicMock()
-        mock_session.payment_status = "paid"
-        mock_retrieve.return_value = mock_session
+        res = post_stripe_event(self.client, stripe_event("test_session_id"))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
 
-        self.client.force_authenticate(user=self.user)
-        res = payment_success(self.client.get("/payment_success_url"), "test_session_id")
+        res = self.client.get(payment_success_url("test_session_id"))
         self.payment.refresh_from_db()
         self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.content.decode(), "Payment Successful!")
+        mock_retrieve.assert_not_called()
 
     @patch("stripe.checkout.Session.retrieve")
-    def test_payment_failed(self, mock_retrieve):
-        mock_session = MagicMock()
-        mock_session.payment_status = "unpaid"
-        mock_retrieve.return_value = mock_session
-
-        self.client.force_authenticate(user=self.user)
-        res = payment_success(self.client.get("/payment_success_url"), "test_session_id")
+    def test_payment_not_confirmed_yet(self, mock_retrieve):
+        res = self.client.get(payment_success_url("test_session_id"))
         self.payment.refresh_from_db()
         self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.content.decode(), "Payment Failed.")
+        self.assertIn("being processed", res.content.decode())
+        mock_retrieve.assert_not_called()
+
+    def test_payment_success_unknown_session(self):
+        res = self.client.get(payment_success_url("unknown"))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_payment_cancel(self):
         # Test payment cancellation
         res = payment_cancelled(self.client.get("/payment_cancelled_url"))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.content.decode(),"Payment was cancelled. Please complete the payment within 24 hours.")
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = get_user_model().objects.create_user(
+            email="example@mail.com", password="password"
+        )
+        book = Book.objects.create(
+            title="Title", author="Author", cover="Hard",
+            inventory=18, daily_fee=1.15
+        )
+        borrowing = Borrowing.objects.create(
+            borrow_date="2022-01-01", expected_return_date="2022-01-27",
+            book=book, user=user
+        )
+        self.payment = Payment.objects.create(
+            status=Payment.StatusChoices.PENDING,
+            type=Payment.TypeChoices.PAYMENT, borrowing=borrowing,
+            session_url="https://checkout.stripe.com/pay/cs_test",
+            session_id="cs_test", money_to_pay=32.2
+        )
+
+    def test_invalid_signature_rejected(self):
+        payload = stripe_event("cs_test")
+        res = post_stripe_event(
+            self.client, payload, sign_stripe_payload(payload, "whsec_fake")
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+    def test_duplicate_delivery_is_idempotent(self):
+        payload = stripe_event("cs_test")
+        for _ in range(2):
+            res = post_stripe_event(self.client, payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=None)
+    def test_rejected_without_secret(self):
+        res = post_stripe_event(self.client, stripe_event("cs_test"))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+    def test_session_without_payment_status_ignored(self):
+        event = json.loads(stripe_event("cs_test"))
+        del event["data"]["object"]["payment_status"]
+        res = post_stripe_event(self.client, json.dumps(event))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+    def test_unpaid_session_ignored(self):
+        post_stripe_event(
+            self.client, stripe_event("cs_test", payment_status="unpaid")
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+    def test_async_payment_succeeded(self):
+        post_stripe_event(
+            self.client,
+            stripe_event(
+                "cs_test",
+                event_type="checkout.session.async_payment_succeeded"
+            ),
+        )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+
+
+class PaymentQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            email="example@mail.com", password="password"
+        )
+        book = Book.objects.create(
+            title="Title", author="Author", cover="Hard",
+            inventory=18, daily_fee=1.15
+        )
+        borrowing = Borrowing.objects.create(
+            borrow_date="2022-01-01", expected_return_date="2022-01-27",
+            book=book, user=user
+        )
+        Payment.objects.bulk_create(
+            Payment(
+                status=Payment.StatusChoices.PENDING,
+                type=Payment.TypeChoices.PAYMENT,
+                borrowing=borrowing,
+                session_url=f"https://checkout.stripe.com/pay/cs_{i}",
+                session_id=f"cs_{i}",
+                money_to_pay=1,
+            )
+            for i in range(5000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE payments_payment")
+
+    def test_session_lookup_uses_unique_index(self):
+        plan = Payment.objects.filter(session_id="cs_42").explain()
+        self.assertIn("Index Scan using payment_session_id_unique", plan)
+
+    def test_duplicate_session_id_rejected(self):
+        payment = Payment.objects.first()
+        payment.pk = None
+        with self.assertRaises(IntegrityError):
+            payment.save()
+
+    def test_blank_session_ids_allowed(self):
+        Payment.objects.filter(session_id__in=["cs_1", "cs_2"]).update(
+            session_id=""
+        )
+        self.assertEqual(2, Payment.objects.filter(session_id="").count())
+
+
+class CheckoutSessionPipelineTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="example@mail.com", password="password"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.client.credentials(**jwt_credentials(self.user))
+        book = Book.objects.create(
+            title="Title", author="Author", cover="Hard",
+            inventory=18, daily_fee=Decimal("1.15")
+        )
+        self.borrowing = Borrowing.objects.create(
+            borrow_date="2022-01-01", expected_return_date="2022-01-27",
+            actual_return_date="2022-01-28", book=book, user=self.user
+        )
+        self.borrowing.refresh_from_db()
+
+    def create_payment(self):
+        with (
+            patch.object(create_checkout_session_task, "delay") as delay,
+            patch("payments.signals.send_notification_task.delay"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            payment = create_stripe_session(self.borrowing)
+        delay.assert_called_once_with(payment.id)
+        return payment
+
+    def test_total_price_includes_overdue_fine(self):
+        # 27 days at 1.15 plus one overdue day at double the fee
+        self.assertEqual(
+            calculate_total_price(self.borrowing), Decimal("33.35")
+        )
+
+    def test_payment_created_pending_without_session(self):
+        with patch("stripe.checkout.Session.create") as create:
+            payment = self.create_payment()
+
+        create.assert_not_called()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.StatusChoices.PENDING)
+        self.assertEqual(payment.session_id, "")
+        self.assertEqual(payment.session_url, "")
+        self.assertEqual(payment.money_to_pay, Decimal("33.35"))
+
+    def test_worker_fills_session_once(self):
+        payment = self.create_payment()
+        stub = StripeSessionStub()
+
+        with patch("stripe.checkout.Session.create", new=stub):
+            create_checkout_session_task.apply((payment.id,))
+            create_checkout_session_task.apply((payment.id,))
+
+        self.assertEqual(len(stub.calls), 1)
+        params = stub.calls[0]
+        self.assertEqual(
+            params["idempotency_key"], f"checkout-session-payment-{payment.id}"
+        )
+        self.assertEqual(
+            params["line_items"][0]["price_data"]["unit_amount"], 3335
+        )
+        payment.refresh_from_db()
+        self.assertEqual(
+            payment.session_id,
+            f"cs_test_checkout-session-payment-{payment.id}",
+        )
+        self.assertTrue(payment.session_url.startswith("https://"))
+
+    def test_worker_retries_transient_errors_with_same_key(self):
+        payment = self.create_payment()
+        stub = StripeSessionStub(failures=[
+            stripe.error.APIConnectionError("connection reset"),
+            stripe.error.RateLimitError("too many requests"),
+        ])
+
+        with patch("stripe.checkout.Session.create", new=stub):
+            result = create_checkout_session_task.apply((payment.id,))
+
+        self.assertTrue(result.successful())
+        self.assertEqual(len(stub.calls), 3)
+        self.assertEqual(
+            len({call["idempotency_key"] for call in stub.calls}), 1
+        )
+        payment.refresh_from_db()
+        self.assertNotEqual(payment.session_url, "")
+
+    def test_session_endpoint_accepted_until_ready(self):
+        payment = self.create_payment()
+
+        res = self.client.get(payment_session_url(payment.id))
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.json()["session_url"], "")
+
+        with patch("stripe.checkout.Session.create", new=StripeSessionStub()):
+            create_checkout_session_task.apply((payment.id,))
+
+        res = self.client.get(payment_session_url(payment.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {
+                "id": payment.id,
+                "status": Payment.StatusChoices.PENDING,
+                "session_id": f"cs_test_checkout-session-payment-{payment.id}",
+                "session_url": "https://checkout.stripe.com/c/pay/"
+                               f"cs_test_checkout-session-payment-{payment.id}",
+            },
+            res.json(),
+        )
+
+    def test_session_endpoint_long_poll(self):
+        payment = self.create_payment()
+
+        @sync_to_async
+        def worker_finishes(seconds):
+            with patch(
+                "stripe.checkout.Session.create", new=StripeSessionStub()
+            ):
+                create_checkout_session_task.apply((payment.id,))
+
+        with patch(
+            "payments.views.asyncio.sleep", side_effect=worker_finishes
+        ) as sleep:
+            res = self.client.get(
+                payment_session_url(payment.id), {"wait": "10"}
+            )
+
+        sleep.assert_awaited_once()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.json()["session_url"].startswith("https://"))
+
+    def test_session_endpoint_invalid_wait(self):
+        payment = self.create_payment()
+        res = self.client.get(payment_session_url(payment.id), {"wait": "x"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            {"wait": "A valid number is required."}, res.json()
+        )
+
+    def test_session_endpoint_unknown_payment(self):
+        res = self.client.get(payment_session_url(0))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_session_endpoint_hides_other_users_payments(self):
+        payment = self.create_payment()
+        other = get_user_model().objects.create_user(
+            email="other@mail.com", password="password"
+        )
+        self.client.credentials(**jwt_credentials(other))
+        res = self.client.get(payment_session_url(payment.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        other.is_staff = True
+        other.save()
+        self.client.credentials(**jwt_credentials(other))
+        res = self.client.get(payment_session_url(payment.id))
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+    def test_session_endpoint_requires_authentication(self):
+        payment = self.create_payment()
+        self.client.credentials()
+        res = self.client.get(payment_session_url(payment.id))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", res)
+
+        self.client.credentials(HTTP_AUTHORIZE="Bearer invalid")
+        res = self.client.get(payment_session_url(payment.id))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class OverdueScanTests(TestCase):
+    today = date(2024, 3, 10)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="example@mail.com", password="password"
+        )
+        self.book = Book.objects.create(
+            title="Title", author="Author", cover="Hard",
+            inventory=18, daily_fee=Decimal("1.50")
+        )
+
+    def borrowing(self, expected_return_date, **kwargs):
+        return Borrowing.objects.create(
+            borrow_date=date(2024, 1, 1),
+            expected_return_date=expected_return_date,
+            book=self.book,
+            user=self.user,
+            **kwargs,
+        )
+
+    def fined_borrowings(self):
+        return set(
+            Payment.objects.filter(type=Payment.TypeChoices.FINE)
+            .values_list("borrowing_id", flat=True)
+        )
+
+    def test_fines_only_active_overdue_borrowings(self):
+        overdue = self.borrowing(self.today - timedelta(days=4))
+        self.borrowing(self.today)
+        self.borrowing(
+            self.today - timedelta(days=4),
+            actual_return_date=self.today - timedelta(days=5),
+        )
+
+        fines = create_overdue_fines(self.today)
+
+        self.assertEqual(self.fined_borrowings(), {overdue.id})
+        fine = Payment.objects.get(id=fines[0].id)
+        self.assertEqual(fine.status, Payment.StatusChoices.PENDING)
+        self.assertEqual(fine.money_to_pay, Decimal("12.00"))
+        self.assertEqual(OverdueScan.objects.get().scanned_until, self.today)
+
+    def test_scan_is_incremental(self):
+        first = self.borrowing(self.today - timedelta(days=1))
+        create_overdue_fines(self.today)
+
+        self.assertEqual(create_overdue_fines(self.today), [])
+
+        second = self.borrowing(self.today)
+        fines = create_overdue_fines(self.today + timedelta(days=1))
+        self.assertEqual([fine.borrowing_id for fine in fines], [second.id])
+        self.assertEqual(self.fined_borrowings(), {first.id, second.id})
+
+    def test_backdated_borrowing_fined_by_next_scan(self):
+        create_overdue_fines(self.today)
+        backdated = self.borrowing(self.today - timedelta(days=10))
+
+        fines = create_overdue_fines(self.today + timedelta(days=1))
+
+        self.assertEqual([fine.borrowing_id for fine in fines], [backdated.id])
+        self.assertEqual(fines[0].money_to_pay, Decimal("33.00"))
+
+    @patch("payments.tasks.create_checkout_session_task.delay")
+    def test_late_return_completes_fine(self, session_delay):
+        swept = self.borrowing(self.today - timedelta(days=1))
+        unswept = self.borrowing(self.today - timedelta(days=2))
+        on_time = self.borrowing(self.today + timedelta(days=3))
+        Payment.objects.create(
+            status=Payment.StatusChoices.PAID,
+            type=Payment.TypeChoices.FINE,
+            borrowing=swept,
+            money_to_pay=Decimal("3.00"),
+        )
+        admin = get_user_model().objects.create_superuser(
+            email="admin@mail.com", password="password"
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        returned = self.today + timedelta(days=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(
+                reverse("borrowings:borrowing-return-borrowing",
+                        kwargs={"pk": swept.id}),
+                {"actual_return_date": returned},
+            )
+            client.post(
+                reverse("borrowings:borrowing-bulk-return"),
+                {"borrowings": [unswept.id, on_time.id],
+                 "actual_return_date": returned},
+                format="json",
+            )
+
+        # every day overdue at twice the 1.50 daily fee
+        self.assertEqual(
+            {
+                (swept.id, Decimal("3.00")),
+                (swept.id, Decimal("9.00")),
+                (unswept.id, Decimal("15.00")),
+            },
+            set(
+                Payment.objects.filter(type=Payment.TypeChoices.FINE)
+                .values_list("borrowing_id", "money_to_pay")
+            ),
+        )
+        self.assertEqual(session_delay.call_count, 2)
+
+    def test_repeat_scan_queries(self):
+        create_overdue_fines(self.today)
+        with self.assertNumQueries(5):
+            # savepoint, checkpoint lock, overdue select, checkpoint
+            # update, savepoint release
+            create_overdue_fines(self.today + timedelta(days=1))
+
+    def test_already_fined_borrowing_skipped(self):
+        borrowing = self.borrowing(self.today - timedelta(days=2))
+        Payment.objects.create(
+            status=Payment.StatusChoices.PENDING,
+            type=Payment.TypeChoices.FINE,
+            borrowing=borrowing,
+            money_to_pay=1,
+        )
+        self.assertEqual(create_overdue_fines(self.today), [])
+
+    @patch("payments.tasks.send_notification_task.delay")
+    @patch("payments.tasks.create_checkout_session_task.delay")
+    def test_task_sends_single_digest(self, session_delay, notify_delay):
+        for days in range(1, 4):
+            self.borrowing(date.today() - timedelta(days=days))
+
+        self.assertEqual(scan_overdue_borrowings_task.apply().get(), 3)
+
+        self.assertEqual(session_delay.call_count, 3)
+        notify_delay.assert_called_once()
+        digest = notify_delay.call_args.args[0]
+        self.assertIn("Overdue borrowings: 3 new", digest)
+        self.assertEqual(digest.count("example@mail.com"), 3)
+
+    @patch("payments.tasks.send_notification_task.delay")
+    def test_task_silent_without_new_overdue(self, notify_delay):
+        self.assertEqual(scan_overdue_borrowings_task.apply().get(), 0)
+        notify_delay.assert_not_called()
+
+    def test_overdue_lookup_uses_partial_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = Borrowing.objects.filter(
+            actual_return_date__isnull=True,
+            expected_return_date__lt=self.today,
+        ).explain()
+        self.assertIn("borrowing_overdue_idx", plan)
+
+
+class PaymentQueryScalingTests(QueryScalingMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="example@mail.com", password="password"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.client.credentials(**jwt_credentials(self.user))
+        self.book = Book.objects.create(
+            title="Title", author="Author", cover="Hard",
+            inventory=18, daily_fee=1.15
+        )
+        self.payment = self.seed_payments(1)[0]
+
+    def seed_payments(self, count):
+        """Each payment gets its own borrowing"""
+        borrowings = Borrowing.objects.bulk_create(
+            Borrowing(
+                borrow_date="2022-01-01", expected_return_date="2022-01-27",
+                book=self.book, user=self.user
+            )
+            for _ in range(count)
+        )
+        return Payment.objects.bulk_create(
+            Payment(
+                status=Payment.StatusChoices.PENDING,
+                type=Payment.TypeChoices.PAYMENT,
+                borrowing=borrowing,
+                session_url=f"https://checkout.stripe.com/pay/{borrowing.id}",
+                session_id=f"cs_{borrowing.id}",
+                money_to_pay=1,
+            )
+            for borrowing in borrowings
+        )
+
+    def test_list(self):
+        self.assertQueriesConstant(
+            self.seed_payments, lambda: self.client.get(PAYMENTS_URLS)
+        )
+
+    def test_retrieve(self):
+        url = reverse(
+            "payments:payment-detail", kwargs={"pk": self.payment.pk}
+        )
+        self.assertQueriesConstant(
+            self.seed_payments, lambda: self.client.get(url)
+        )
+
+    def test_session(self):
+        self.assertQueriesConstant(
+            self.seed_payments,
+            lambda: self.client.get(payment_session_url(self.payment.pk)),
+        )
+
+    def test_payment_success(self):
+        self.assertQueriesConstant(
+            self.seed_payments,
+            lambda: self.client.get(
+                payment_success_url(self.payment.session_id)
+            ),
+        )
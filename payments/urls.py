@@ -10,9 +10,11 @@ router.register("", PaymentViewSet)
 
 
 urlpatterns = [
-    path("", include(router.urls)),
+    path("webhook/", views.stripe_webhook, name="stripe_webhook"),
     path("payment-success/<str:session_id>/", views.payment_success, name="payment_success"),
     path("payment-cancelled/", views.payment_cancelled, name="payment_cancelled"),
+    path("<int:pk>/session/", views.payment_session, name="payment-session"),
+    path("", include(router.urls)),
 ]
 
 app_name = "payments"
@@ -1,25 +1,49 @@
+import asyncio
+import time
+
 import stripe
-from django.db import transaction
-from django.http import HttpResponse
-from rest_framework import viewsets, mixins
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import viewsets, mixins, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
-from library import settings
+from library.async_api import api_response, async_api_view, authenticate
+from library.metrics import SerializerMetricsMixin
+from library.pagination import NewestFirstCursorPagination
+from library.routers import ReplicaReadMixin, pin_to_primary
+from library.rows import ValuesListMixin, row_formatter
 from payments.models import Payment
 from payments.serializers import (
     PaymentSerializer,
     PaymentDetailSerializer,
     PaymentListSerializer,
+    PaymentSessionSerializer,
+)
+from users.summary import change_summaries
+
+PAID_SESSION_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
 )
+SESSION_POLL_INTERVAL = 0.5
 
 
 class PaymentViewSet(
+    SerializerMetricsMixin,
+    ReplicaReadMixin,
+    ValuesListMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet
 ):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = NewestFirstCursorPagination
 
     def get_permissions(self):
         if self.action in ["retrieve", "list"]:
@@ -34,18 +58,118 @@ class PaymentViewSet(
         return PaymentListSerializer
 
 
-@transaction.atomic
-def payment_success(request, session_id):
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    session = stripe.checkout.Session.retrieve(session_id)
+def _session_wait(request):
+    """Parses ?wait= into seconds, capped by PAYMENT_SESSION_MAX_WAIT"""
+    value = request.GET.get("wait", "0")
+    try:
+        wait = float(value)
+    except ValueError:
+        raise ValidationError({"wait": "A valid number is required."})
+    return min(max(wait, 0), settings.PAYMENT_SESSION_MAX_WAIT)
+
+
+@sync_to_async
+def _release_connection():
+    """
+    Close the request's connection while a long poll sleeps, otherwise
+    every waiting client holds a database connection under ASGI
+    """
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+@require_GET
+@async_api_view
+async def payment_session(request, pk):
+    """
+    Checkout session of a payment. Answers 202 while the worker is
+    still creating it; with ?wait= it polls until the session is ready
+    or the wait runs out, without holding a thread meanwhile. Users only
+    see sessions of their own borrowings; staff see every session.
+    """
+    user = await authenticate(request)
+    deadline = time.monotonic() + _session_wait(request)
+    formatter = row_formatter(PaymentSessionSerializer)
+    payments = Payment.objects.filter(pk=pk)
+    if not user.is_staff:
+        payments = payments.filter(borrowing__user_id=user.id)
+    payment = formatter.values(payments)
+
+    row = await payment.afirst()
+    if row is None:
+        raise NotFound()
+    while not row["session_url"] and time.monotonic() < deadline:
+        await _release_connection()
+        await asyncio.sleep(SESSION_POLL_INTERVAL)
+        row = await payment.afirst()
+    return api_response(
+        formatter.format([row])[0],
+        status=(
+            status.HTTP_200_OK
+            if row["session_url"]
+            else status.HTTP_202_ACCEPTED
+        ),
+    )
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """
+    Receives signed Stripe events and marks paid checkout sessions.
+    Only pending payments are updated, under a row lock, so Stripe's
+    retries and duplicate deliveries are no-ops and the payers'
+    outstanding totals drop exactly once.
+    """
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        return HttpResponseBadRequest("Stripe webhooks aren't configured")
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body,
+            request.META.get("HTTP_STRIPE_SIGNATURE", ""),
+            settings.STRIPE_WEBHOOK_SECRET,
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponseBadRequest("Invalid Stripe event")
+
+    if event["type"] in PAID_SESSION_EVENTS:
+        session = event["data"]["object"]
+        if session.get("payment_status") == "paid":
+            with transaction.atomic():
+                paid = list(
+                    Payment.objects.select_for_update(of=("self",))
+                    .filter(
+                        session_id=session["id"],
+                        status=Payment.StatusChoices.PENDING,
+                    )
+                    .values_list("id", "borrowing__user_id", "money_to_pay")
+                )
+                Payment.objects.filter(
+                    id__in=[payment_id for payment_id, _, _ in paid]
+                ).update(status=Payment.StatusChoices.PAID)
+                changes = {}
+                for _, user_id, money_to_pay in paid:
+                    deltas = changes.setdefault(user_id, {"outstanding": 0})
+                    deltas["outstanding"] -= money_to_pay
+                change_summaries(changes)
+                pin_to_primary(*changes)
+    return HttpResponse(status=200)
 
-    if session.payment_status == "paid":
-        payment = Payment.objects.get(session_id=session_id)
-        payment.status = Payment.StatusChoices.PAID
-        payment.save()
+
+async def payment_success(request, session_id):
+    """Reports the payment state recorded by the webhook"""
+    payment_status = await (
+        Payment.objects.filter(session_id=session_id)
+        .values_list("status", flat=True)
+        .afirst()
+    )
+    if payment_status is None:
+        raise Http404("Payment not found")
+    if payment_status == Payment.StatusChoices.PAID:
         return HttpResponse("Payment Successful!")
-    else:
-        return HttpResponse("Payment Failed.")
+    return HttpResponse(
+        "Payment is being processed. Please refresh this page in a moment."
+    )
 
 
 def payment_cancelled(request):
@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import salted_hmac
+from django.utils.functional import cached_property
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+# claim holding auth_hash() of the user at issue time
+AUTH_CLAIM = "auth"
+
+
+def _auth_state_key(user_id):
+    return f"users:auth:{user_id}"
+
+
+def _user_key(user_id):
+    return f"users:user:{user_id}"
+
+
+def _auth_hash(password, is_staff, is_active):
+    """
+    Changes whenever the password, staff flag or active flag does, which
+    revokes every token issued before, like Django's session auth hash
+    """
+    return salted_hmac(
+        "users.authentication.auth_hash",
+        f"{password}:{is_staff}:{is_active}",
+        algorithm="sha256",
+    ).hexdigest()[:16]
+
+
+def auth_hash(user):
+    return _auth_hash(user.password, user.is_staff, user.is_active)
+
+
+def current_auth_hash(user_id):
+    """The user's auth hash from the cache, else the database, or None"""
+    key = _auth_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = (
+            get_user_model().objects.filter(pk=user_id)
+            .values_list("password", "is_staff", "is_active")
+            .first()
+        )
+        if row is None:
+            return None
+        state = _auth_hash(*row)
+        cache.set(key, state, settings.JWT_PRINCIPAL_CACHE_TIMEOUT)
+    return state
+
+
+def forget_cached_users(*user_ids):
+    """
+    Drop the users' cached auth hashes and instances now, so the current
+    transaction never reads them, and again after commit, so values
+    cached meanwhile from the pre-commit state are dropped as well
+    """
+    keys = [
+        key
+        for user_id in user_ids
+        for key in (_auth_state_key(user_id), _user_key(user_id))
+    ]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class PrincipalClaimsMixin:
+    """Tokens carrying the claims UserPrincipal is built from"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token["email"] = user.email
+        token["is_staff"] = user.is_staff
+        token[AUTH_CLAIM] = auth_hash(user)
+        return token
+
+
+class AccessToken(PrincipalClaimsMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(PrincipalClaimsMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
+
+
+class UserPrincipal(TokenUser):
+    """
+    The authenticated user as described by the access token: id, email
+    and is_staff without a database read. `get_user()` loads the model
+    instance, cached for JWT_PRINCIPAL_CACHE_TIMEOUT, when one is needed.
+    """
+
+    @cached_property
+    def email(self):
+        return self.token.get("email", "")
+
+    def __str__(self):
+        return self.email
+
+    @cached_property
+    def _user(self):
+        key = _user_key(self.id)
+        user = cache.get(key)
+        if user is None:
+            user = get_user_model().objects.get(pk=self.id)
+            cache.set(key, user, settings.JWT_PRINCIPAL_CACHE_TIMEOUT)
+        return user
+
+    def get_user(self):
+        return self._user
+
+
+def full_user(user):
+    """The request user as a users.User instance"""
+    if isinstance(user, UserPrincipal):
+        return user.get_user()
+    return user
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication answering with a UserPrincipal built from the token
+    claims. The only lookup is the user's current auth hash, from the
+    cache, so a password, staff or active change revokes older tokens.
+    Tokens without the claims, issued before, load the user as usual.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if AUTH_CLAIM not in validated_token or user_id is None:
+            return super().get_user(validated_token)
+
+        if current_auth_hash(user_id) != validated_token[AUTH_CLAIM]:
+            raise AuthenticationFailed(
+                "Token is no longer valid", code="token_revoked"
+            )
+        return UserPrincipal(validated_token)
@@ -0,0 +1,112 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.exceptions import Throttled
+
+from library.metrics import PASSWORD_HASH_DURATION, PASSWORD_HASH_REJECTED
+
+
+class PasswordHashingBusy(Throttled):
+    default_detail = "Too many sign-ins at the moment, please retry shortly."
+    default_code = "password_hashing_busy"
+
+
+def _setup_worker():
+    django.setup()
+
+
+class HashingPool:
+    """
+    Runs password hashing in `workers` processes, or in the calling thread
+    when `workers` is 0, with at most `queue` jobs waiting beyond those
+    running. Jobs past that are refused with PasswordHashingBusy (429 and
+    Retry-After), so a login storm can't take every request thread.
+    """
+
+    def __init__(self, workers, queue, retry_after):
+        self.workers = workers
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, initializer=_setup_worker
+                )
+            return self._executor
+
+    def run(self, operation, function, *args):
+        labels = (("operation", operation),)
+        if not self._slots.acquire(blocking=False):
+            PASSWORD_HASH_REJECTED.inc(labels)
+            raise PasswordHashingBusy(wait=self.retry_after)
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                return function(*args)
+            return self._get_executor().submit(function, *args).result()
+        finally:
+            self._slots.release()
+            PASSWORD_HASH_DURATION.observe(
+                labels, time.perf_counter() - start
+            )
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(
+                settings.PASSWORD_HASHING_WORKERS,
+                settings.PASSWORD_HASHING_QUEUE,
+                settings.PASSWORD_HASHING_RETRY_AFTER,
+            )
+        return _pool
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    global _pool
+    if setting.startswith("PASSWORD_HASHING_"):
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = None
+
+
+def make_password(raw_password):
+    """hashers.make_password through the hashing pool"""
+    if raw_password is None:
+        return hashers.make_password(None)
+    return get_pool().run("make", hashers.make_password, raw_password)
+
+
+def check_password(raw_password, encoded, setter=None):
+    """hashers.check_password with the verification in the hashing pool"""
+    if raw_password is None or not hashers.is_password_usable(encoded):
+        return False
+    is_correct, must_update = get_pool().run(
+        "check", hashers.verify_password, raw_password, encoded
+    )
+    if setter and is_correct and must_update:
+        setter(raw_password)
+    return is_correct
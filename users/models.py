@@ -5,6 +5,8 @@ from django.contrib.auth.models import (
 from django.db import models
 from django.utils.translation import gettext as _
 
+from users import hashing
+
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
@@ -48,3 +50,41 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+
+    # hashing goes through the bounded pool, see users.hashing
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # password hash upgrades aren't password changes
+            self._password = None
+            self.save(update_fields=["password"])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
+
+class UserSummary(models.Model):
+    """
+    Per-user borrowing counters, kept in step by users.summary wherever
+    borrowings and payments change, so the summary is a primary key read
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="summary",
+    )
+    active_borrowings = models.IntegerField(default=0)
+    # active borrowings the overdue sweep has fined
+    overdue_borrowings = models.IntegerField(default=0)
+    # money_to_pay of the pending payments
+    outstanding = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0
+    )
+
+    def __str__(self):
+        return f"{self.user_id}: {self.active_borrowings} active"
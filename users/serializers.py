@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+
+from users.authentication import RefreshToken
+from users.models import UserSummary
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -22,3 +26,13 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
 
         return user
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserSummary
+        fields = ("active_borrowings", "overdue_borrowings", "outstanding")
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = RefreshToken
@@ -0,0 +1,12 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import forget_cached_users
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_auth_state(sender, instance, **kwargs):
+    """A changed password, staff or active flag revokes older tokens"""
+    forget_cached_users(instance.pk)
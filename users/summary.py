@@ -0,0 +1,211 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from borrowings.models import Borrowing
+from payments.models import Payment
+from users.models import UserSummary
+
+COUNTERS = {
+    "active_borrowings": IntegerField(),
+    "overdue_borrowings": IntegerField(),
+    "outstanding": DecimalField(max_digits=12, decimal_places=2),
+}
+UPDATE_BATCH_SIZE = 500
+
+_tracked = ContextVar("summary_tracked_writes", default=False)
+
+
+@contextmanager
+def tracked_writes():
+    """
+    Marks the borrowing and payment saves inside as followed by the
+    caller's own change_summaries(); the save signals forget the
+    summaries of any other save (admin, shell), which they can't follow
+    """
+    token = _tracked.set(True)
+    try:
+        yield
+    finally:
+        _tracked.reset(token)
+
+
+def writes_tracked():
+    return _tracked.get()
+
+
+def _aggregate(queryset, expression, output_field):
+    """Correlated subquery of one aggregate over queryset, 0 when empty"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values("user")
+            .annotate(total=expression).values("total"),
+            output_field=output_field,
+        ),
+        Value(0, output_field=output_field),
+    )
+
+
+def count_summaries(*user_ids):
+    """
+    The users' counters recounted from their borrowing and payment
+    history, {user_id: {counter: value}}
+    """
+    active = Borrowing.objects.filter(
+        user=OuterRef("pk"), actual_return_date__isnull=True
+    )
+    fined = Payment.objects.filter(
+        borrowing=OuterRef("pk"), type=Payment.TypeChoices.FINE
+    )
+    pending = Payment.objects.filter(
+        borrowing__user=OuterRef("pk"),
+        status=Payment.StatusChoices.PENDING,
+    ).values("borrowing__user")
+    rows = (
+        get_user_model().objects.filter(pk__in=user_ids)
+        .annotate(
+            active_borrowings=_aggregate(
+                active, Count("*"), COUNTERS["active_borrowings"]
+            ),
+            overdue_borrowings=_aggregate(
+                active.filter(Exists(fined)),
+                Count("*"),
+                COUNTERS["overdue_borrowings"],
+            ),
+            outstanding=Coalesce(
+                Subquery(
+                    pending.annotate(total=Sum("money_to_pay"))
+                    .values("total"),
+                    output_field=COUNTERS["outstanding"],
+                ),
+                Value(Decimal(0), output_field=COUNTERS["outstanding"]),
+            ),
+        )
+        .values("pk", *COUNTERS)
+    )
+    return {row.pop("pk"): row for row in rows}
+
+
+def create_summaries(*user_ids):
+    """
+    Creates the summaries the users don't have yet, counted from their
+    history; a summary is created the first time it's needed, and again
+    after changes the counters can't follow (deletions, untracked saves).
+    The user rows are held meanwhile, so a writer that found no summary
+    waits and then adds its change to the created one
+    (change_summaries()); a recount never overwrites a summary, which may
+    lack uncommitted changes.
+    Returns the ids of the users whose summary was created.
+    """
+    with transaction.atomic():
+        # NO KEY: borrowings and payments being written keep inserting
+        list(
+            get_user_model().objects.filter(pk__in=user_ids)
+            .order_by("pk")
+            .select_for_update(no_key=True)
+            .values_list("pk", flat=True)
+        )
+        existing = UserSummary.objects.filter(
+            user_id__in=user_ids
+        ).values_list("user_id", flat=True)
+        counts = count_summaries(*(set(user_ids) - set(existing)))
+        UserSummary.objects.bulk_create(
+            [
+                UserSummary(user_id=user_id, **counters)
+                for user_id, counters in counts.items()
+            ],
+            ignore_conflicts=True,
+        )
+    return set(counts)
+
+
+def _delta(value, output_field):
+    if hasattr(value, "resolve_expression"):
+        return value
+    return Value(value, output_field=output_field)
+
+
+def _update_summaries(user_ids, updates):
+    """Applies `updates` to the users' summaries, returns who has none"""
+    summaries = UserSummary.objects.filter(user_id__in=user_ids)
+    if summaries.update(**updates) == len(user_ids):
+        return []
+    if len(user_ids) == 1:
+        return list(user_ids)
+    existing = set(summaries.values_list("user_id", flat=True))
+    return [user_id for user_id in user_ids if user_id not in existing]
+
+
+def change_summaries(changes):
+    """
+    Add {user_id: {counter: delta}} to the users' counters, in the
+    caller's transaction and after its write; a delta may be an
+    expression, evaluated in the UPDATE. One UPDATE per batch of users
+    increments the stored values, so concurrent changes never lose each
+    other. Users without a summary get one created, which already counts
+    the write, unless another transaction created it meanwhile: the
+    change is then added to theirs.
+    """
+    user_ids = [
+        user_id for user_id, deltas in changes.items() if any(deltas.values())
+    ]
+    for start in range(0, len(user_ids), UPDATE_BATCH_SIZE):
+        batch = user_ids[start:start + UPDATE_BATCH_SIZE]
+        updates = {}
+        for name, output_field in COUNTERS.items():
+            whens = [
+                When(user_id=user_id, then=_delta(
+                    changes[user_id][name], output_field
+                ))
+                for user_id in batch
+                if changes[user_id].get(name)
+            ]
+            if whens:
+                updates[name] = F(name) + Case(
+                    *whens,
+                    default=Value(0, output_field=output_field),
+                    output_field=output_field,
+                )
+        missing = _update_summaries(batch, updates)
+        if missing:
+            created = create_summaries(*missing)
+            # created by a concurrent writer while we waited for the users
+            created_meanwhile = [
+                user_id for user_id in missing if user_id not in created
+            ]
+            if created_meanwhile:
+                _update_summaries(created_meanwhile, updates)
+
+
+def change_summary(user_id, **deltas):
+    change_summaries({user_id: deltas})
+
+
+def forget_summaries(*user_ids):
+    """Drop the summaries, rebuilt from history when next needed"""
+    UserSummary.objects.filter(user_id__in=user_ids).delete()
+
+
+def get_summary(user_id):
+    summary = UserSummary.objects.filter(user_id=user_id).first()
+    if summary is None:
+        create_summaries(user_id)
+        summary = UserSummary.objects.filter(user_id=user_id).first()
+    return summary
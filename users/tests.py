@@ -1,8 +1,42 @@
-from django.contrib.auth import get_user_model
-from django.test import TestCase
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model, hashers
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken as PlainAccessToken
 from django.urls import reverse
+from django.utils import timezone
+
+from books.models import Book
+from books.tests import sample_book
+from borrowings.models import Borrowing
+from borrowings.tests import (
+    BULK_BORROW_URL,
+    BULK_RETURN_URL,
+    get_borrowing_list_url,
+    get_borrowing_return_url,
+)
+from library.metrics import PASSWORD_HASH_DURATION, PASSWORD_HASH_REJECTED
+from library.testing import QueryScalingMixin
+from users import hashing
+from payments.fines import create_overdue_fines
+from payments.models import Payment
+from payments.tests import WEBHOOK_SECRET, post_stripe_event, stripe_event
+from users.authentication import AccessToken, UserPrincipal
+from users.models import UserSummary
+from users.summary import (
+    COUNTERS,
+    change_summary,
+    count_summaries,
+    create_summaries,
+)
 
 
 def sample_user():
@@ -18,10 +52,18 @@ def get_me_url():
     return reverse("users:manage")
 
 
+def summary_url():
+    return reverse("users:summary")
+
+
 def register_url():
     return reverse("users:create")
 
 
+def borrowing_list_url():
+    return reverse("borrowings:borrowing-list")
+
+
 class UserUnauthorizedTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -60,3 +102,332 @@ class UserAuthorizerTests(TestCase):
         user_id = res.data["id"]
         user = get_user_model().objects.get(id=user_id)
         self.assertTrue(not user.is_staff)
+
+
+class UserQueryScalingTests(QueryScalingMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.seeded = 0
+
+    def seed_users(self, count):
+        get_user_model().objects.bulk_create(
+            get_user_model()(email=f"reader{self.seeded + i}@mail.com")
+            for i in range(count)
+        )
+        self.seeded += count
+
+    def test_register(self):
+        emails = iter(f"new{i}@mail.com" for i in range(2))
+        self.assertQueriesConstant(
+            self.seed_users,
+            lambda: self.client.post(
+                register_url(), {**sample_user(), "email": next(emails)}
+            ),
+        )
+
+    def test_me(self):
+        user = get_user_model().objects.create_user(**sample_user())
+        self.client.force_authenticate(user)
+        self.assertQueriesConstant(
+            self.seed_users, lambda: self.client.get(get_me_url())
+        )
+
+
+class PrincipalJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(**sample_user())
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZE=f"Bearer {token}")
+
+    def obtain_token(self, password=sample_user()["password"]):
+        res = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"email": self.user.email, "password": password},
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        return res.data["access"]
+
+    def test_token_claims(self):
+        token = AccessToken(self.obtain_token())
+        self.assertEqual(self.user.email, token["email"])
+        self.assertFalse(token["is_staff"])
+
+    def test_principal_without_user_query(self):
+        self.authorize(self.obtain_token())
+        self.client.get(borrowing_list_url())
+
+        # the auth hash is cached now, the user row is never read
+        with self.assertNumQueries(1):
+            res = self.client.get(borrowing_list_url())
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertIsInstance(res.wsgi_request.user, UserPrincipal)
+        self.assertEqual(self.user.id, res.wsgi_request.user.id)
+
+    def test_full_user_loaded_when_needed(self):
+        self.authorize(AccessToken.for_user(self.user))
+        res = self.client.get(get_me_url())
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertEqual(self.user.email, res.data["email"])
+
+        with self.assertNumQueries(0):
+            self.client.get(get_me_url())
+
+    def test_password_change_revokes_tokens(self):
+        old_token = self.obtain_token()
+        self.authorize(old_token)
+        res = self.client.patch(get_me_url(), {"password": "new-password"})
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+        res = self.client.get(get_me_url())
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, res.status_code)
+
+        self.authorize(self.obtain_token(password="new-password"))
+        res = self.client.get(get_me_url())
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+    def test_staff_change_revokes_tokens(self):
+        self.authorize(self.obtain_token())
+        self.client.get(get_me_url())
+
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(get_me_url())
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, res.status_code)
+
+    def test_token_without_claims_loads_user(self):
+        self.authorize(PlainAccessToken.for_user(self.user))
+        res = self.client.get(get_me_url())
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        self.assertIsInstance(res.wsgi_request.user, get_user_model())
+
+
+class PasswordHashingPoolTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(**sample_user())
+
+    @override_settings(PASSWORD_HASHING_QUEUE=0)
+    def test_saturated_pool_answers_429(self):
+        started, release = threading.Event(), threading.Event()
+        make_password = hashers.make_password
+
+        def slow_make_password(*args):
+            started.set()
+            release.wait(5)
+            return make_password(*args)
+
+        with mock.patch.object(hashers, "make_password", slow_make_password):
+            hashing_thread = threading.Thread(
+                target=hashing.make_password, args=("password",)
+            )
+            hashing_thread.start()
+            started.wait(5)
+            try:
+                register = self.client.post(
+                    register_url(),
+                    {"email": "new@test.com", "password": "password"},
+                )
+                token = self.client.post(
+                    reverse("users:token_obtain_pair"),
+                    {
+                        "email": self.user.email,
+                        "password": sample_user()["password"],
+                    },
+                )
+            finally:
+                release.set()
+                hashing_thread.join()
+
+        for res in (register, token):
+            self.assertEqual(
+                status.HTTP_429_TOO_MANY_REQUESTS, res.status_code
+            )
+            self.assertEqual("1", res["Retry-After"])
+        self.assertFalse(
+            get_user_model().objects.filter(email="new@test.com").exists()
+        )
+        rejected = list(PASSWORD_HASH_REJECTED.collect())
+        self.assertIn(
+            'library_password_hash_rejected_total{operation="check"} ',
+            "\n".join(rejected),
+        )
+
+        # with the slot free again the same calls go through
+        res = self.client.post(
+            reverse("users:token_obtain_pair"),
+            {"email": self.user.email, "password": sample_user()["password"]},
+        )
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+
+    def test_hash_latency_recorded(self):
+        self.assertTrue(self.user.check_password(sample_user()["password"]))
+        self.assertIn(
+            "library_password_hash_duration_seconds_count"
+            '{operation="check"}',
+            "\n".join(PASSWORD_HASH_DURATION.collect()),
+        )
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1)
+    def test_hashes_in_worker_process(self):
+        encoded = hashing.make_password("password")
+        self.assertTrue(hashers.check_password("password", encoded))
+        self.assertTrue(hashing.check_password("password", encoded))
+        self.assertFalse(hashing.check_password("wrong", encoded))
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class UserSummaryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate()
+        self.book = Book.objects.create(
+            **{**sample_book(), "inventory": 5, "daily_fee": Decimal("2")}
+        )
+        self.overdue = Borrowing.objects.create(
+            borrow_date=self.today - timedelta(days=10),
+            expected_return_date=self.today - timedelta(days=3),
+            book=self.book,
+            user=self.user,
+        )
+
+    def summary(self):
+        res = self.client.get(summary_url())
+        self.assertEqual(status.HTTP_200_OK, res.status_code)
+        return (
+            res.data["active_borrowings"],
+            res.data["overdue_borrowings"],
+            res.data["outstanding"],
+        )
+
+    def stored(self):
+        return UserSummary.objects.filter(user=self.user).values().get()
+
+    @mock.patch("borrowings.bulk.send_notification_task.delay")
+    @mock.patch("borrowings.signals.send_notification_task.delay")
+    def test_counters_follow_borrowings_and_payments(self, *mocks):
+        # built from history on the first read
+        self.assertEqual((1, 0, "0.00"), self.summary())
+
+        fine = create_overdue_fines()[0]
+        self.assertEqual((1, 1, "12.00"), self.summary())
+
+        expected_return_date = str(self.today + timedelta(days=7))
+        self.client.post(
+            get_borrowing_list_url(),
+            {"book": self.book.id,
+             "expected_return_date": expected_return_date},
+        )
+        self.client.post(
+            BULK_BORROW_URL,
+            {"books": [self.book.id],
+             "expected_return_date": expected_return_date},
+            format="json",
+        )
+        self.assertEqual((3, 1, "12.00"), self.summary())
+
+        self.client.force_authenticate(self.admin)
+        self.client.post(
+            get_borrowing_return_url(self.overdue.id),
+            {"actual_return_date": self.today},
+        )
+        self.client.post(
+            BULK_RETURN_URL,
+            {"borrowings": list(
+                Borrowing.objects.filter(user=self.user)
+                .exclude(id=self.overdue.id).values_list("id", flat=True)[:1]
+            )},
+            format="json",
+        )
+        Payment.objects.filter(id=fine.id).update(session_id="cs_fine")
+        post_stripe_event(self.client, stripe_event("cs_fine"))
+        self.client.force_authenticate(self.user)
+        self.assertEqual((1, 0, "0.00"), self.summary())
+
+        stored = self.stored()
+        self.assertEqual(
+            count_summaries(self.user.id)[self.user.id],
+            {name: stored[name] for name in COUNTERS},
+        )
+
+    def test_read_is_one_query(self):
+        self.summary()
+        with self.assertNumQueries(1):
+            self.summary()
+
+    def test_untracked_saves_recounted(self):
+        fine = create_overdue_fines()[0]
+        self.assertEqual((1, 1, "12.00"), self.summary())
+        # as saved from the admin site
+        fine.status = Payment.StatusChoices.PAID
+        fine.save()
+        self.assertEqual((1, 1, "0.00"), self.summary())
+        self.overdue.actual_return_date = self.today
+        self.overdue.save()
+        self.assertEqual((0, 0, "0.00"), self.summary())
+
+    def test_moved_borrowing_recounted_for_both_users(self):
+        other = get_user_model().objects.create_user(
+            "other@test.com", "password"
+        )
+        self.assertEqual((1, 0, "0.00"), self.summary())
+        create_summaries(other.id)
+        self.overdue.user = other
+        self.overdue.save()
+        self.assertEqual((0, 0, "0.00"), self.summary())
+        self.client.force_authenticate(other)
+        self.assertEqual((1, 0, "0.00"), self.summary())
+
+    def test_deleted_borrowing_recounted(self):
+        self.summary()
+        self.overdue.delete()
+        self.assertFalse(UserSummary.objects.filter(user=self.user).exists())
+        self.assertEqual((0, 0, "0.00"), self.summary())
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        res = self.client.get(summary_url())
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, res.status_code)
+
+
+class UserSummaryConcurrencyTests(TransactionTestCase):
+    workers = 8
+
+    @mock.patch("borrowings.signals.send_notification_task.delay")
+    def test_concurrent_first_changes_all_counted(self, _):
+        user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        book = Book.objects.create(**{**sample_book(), "inventory": 8})
+        barrier = threading.Barrier(self.workers)
+
+        def borrow(_):
+            try:
+                with transaction.atomic():
+                    Borrowing.objects.create(
+                        expected_return_date=timezone.localdate(),
+                        book=book,
+                        user=user,
+                    )
+                    # every summary is missing when its writer looks
+                    barrier.wait()
+                    change_summary(user.id, active_borrowings=1)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            list(executor.map(borrow, range(self.workers)))
+
+        self.assertEqual(
+            self.workers, UserSummary.objects.get(user=user).active_borrowings
+        )
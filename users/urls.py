@@ -5,7 +5,7 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 
-from users.views import CreateUserView, ManageUserView
+from users.views import CreateUserView, ManageUserView, UserSummaryView
 
 
 urlpatterns = [
@@ -14,6 +14,7 @@ urlpatterns = [
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("token/verify/", TokenVerifyView.as_view(), name="token_verify"),
     path("me/", ManageUserView.as_view(), name="manage"),
+    path("me/summary/", UserSummaryView.as_view(), name="summary"),
 ]
 
 app_name = "users"
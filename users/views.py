@@ -1,7 +1,9 @@
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 
-from users.serializers import UserSerializer
+from users.authentication import full_user
+from users.serializers import UserSerializer, UserSummarySerializer
+from users.summary import get_summary
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -13,4 +15,14 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
-        return self.request.user
+        return full_user(self.request.user)
+
+
+class UserSummaryView(generics.RetrieveAPIView):
+    """Active and overdue borrowings and the money still to pay"""
+
+    serializer_class = UserSummarySerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_object(self):
+        return get_summary(self.request.user.id)